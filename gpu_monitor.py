@@ -1,47 +1,215 @@
+import os
+import ctypes
 import pynvml
+import threading
 import time
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 import logging
 
+# DCGM为可选依赖，可用时由DCGM后台采集GPU指标，否则直接查询NVML
+try:
+    import pydcgm
+    import dcgm_fields
+    import dcgm_structs
+except ImportError:
+    pydcgm = None
+
+# DCGM字段更新周期（微秒）
+_DCGM_UPDATE_FREQ_US = 500000
+
 
 class GPUMonitor:
     """GPU监控类，用于获取GPU状态信息"""
 
     def __init__(self):
+        # 后台轮询间隔，查询方直接读取最近一次的快照，不再同步调用NVML
+        self._ttl = float(os.getenv('GPU_POLL_INTERVAL_SECONDS', '3'))
+        self._snapshot: List[Dict] = []
+        self._stop = False
+        self._wake = threading.Event()
+        self._poll_thread = None
+        # 每次刷新快照后回调，用于唤醒等待GPU的调度循环
+        self._refresh_listeners: List[Callable[[], None]] = []
+
         try:
             pynvml.nvmlInit()
             self.device_count = pynvml.nvmlDeviceGetCount()
+            # 设备句柄和名称在运行期间不变，初始化时解析一次
+            self._handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(self.device_count)]
+            self._names = [pynvml.nvmlDeviceGetName(h).decode('utf-8') for h in self._handles]
+            # 每个设备上次读取到的采样时间戳，用于增量读取NVML采样缓冲区
+            self._last_seen = [0] * self.device_count
+            self._init_direct_calls()
+            self._init_dcgm()
             logging.info(f"成功初始化GPU监控，检测到 {self.device_count} 个GPU")
         except Exception as e:
             logging.error(f"GPU监控初始化失败: {e}")
             self.device_count = 0
+            self._handles = []
+            self._names = []
+            self._last_seen = []
+            self._fn_memory_info = None
+            self._fn_utilization = None
+            self._dcgm_group = None
+
+        # 先同步采集一次，保证启动后立即有可用快照
+        self._snapshot = self._build_snapshot()
+        if self.device_count > 0:
+            self._poll_thread = threading.Thread(target=self._poll_loop, daemon=True)
+            self._poll_thread.start()
+
+    def _init_direct_calls(self):
+        """直接解析NVML C函数并预分配输出结构体，热路径上绕过pynvml的包装层"""
+        try:
+            self._fn_memory_info = pynvml._nvmlGetFunctionPointer("nvmlDeviceGetMemoryInfo")
+            self._fn_utilization = pynvml._nvmlGetFunctionPointer("nvmlDeviceGetUtilizationRates")
+            self._mem = pynvml.c_nvmlMemory_t()
+            self._util = pynvml.c_nvmlUtilization_t()
+        except Exception as e:
+            logging.warning(f"无法直接调用NVML函数，使用pynvml接口: {e}")
+            self._fn_memory_info = None
+            self._fn_utilization = None
+
+    def _init_dcgm(self):
+        """初始化DCGM字段订阅，DCGM不可用时使用NVML查询"""
+        self._dcgm_group = None
+        if pydcgm is None:
+            return
+        try:
+            self._dcgm_handle = pydcgm.DcgmHandle(opMode=dcgm_structs.DCGM_OPERATION_MODE_AUTO)
+            group = pydcgm.DcgmGroup(self._dcgm_handle, groupName='gpu-scheduler',
+                                     groupType=dcgm_structs.DCGM_GROUP_DEFAULT)
+            self._dcgm_fields = pydcgm.DcgmFieldGroup(self._dcgm_handle, name='gpu-scheduler-fields', fieldIds=[
+                dcgm_fields.DCGM_FI_DEV_GPU_UTIL,
+                dcgm_fields.DCGM_FI_DEV_MEM_COPY_UTIL,
+                dcgm_fields.DCGM_FI_DEV_FB_USED,
+                dcgm_fields.DCGM_FI_DEV_FB_TOTAL,
+            ])
+            group.samples.WatchFields(self._dcgm_fields, _DCGM_UPDATE_FREQ_US, 3600.0, 0)
+            self._dcgm_gpu_ids = self._map_dcgm_gpu_ids()
+            self._dcgm_group = group
+            logging.info("使用DCGM采集GPU指标")
+        except Exception as e:
+            logging.warning(f"DCGM初始化失败，使用NVML查询GPU指标: {e}")
+
+    def _map_dcgm_gpu_ids(self) -> List[Optional[int]]:
+        """按UUID将NVML设备序号对应到DCGM的gpuId，两者的编号不保证一致；找不到对应设备时为None"""
+        discovery = self._dcgm_handle.GetSystem().discovery
+        gpu_ids = {}
+        for gpu_id in discovery.GetAllSupportedGpuIds():
+            uuid = discovery.GetGpuAttributes(gpu_id).identifiers.uuid
+            gpu_ids[uuid.decode('utf-8') if isinstance(uuid, bytes) else uuid] = gpu_id
+        result = []
+        for handle in self._handles:
+            uuid = pynvml.nvmlDeviceGetUUID(handle)
+            result.append(gpu_ids.get(uuid.decode('utf-8') if isinstance(uuid, bytes) else uuid))
+        return result
+
+    def _read_dcgm_metrics(self, values, index: int) -> Optional[Tuple[int, int, int, int, int]]:
+        """从DCGM最新值中读取(总显存, 已用显存, 空闲显存, GPU利用率, 显存利用率)，index为NVML设备序号，
+        数据不完整或设备无对应的DCGM gpuId时返回None"""
+        gpu_id = self._dcgm_gpu_ids[index]
+        if gpu_id is None:
+            return None
+        try:
+            gpu_values = values[gpu_id]
+            latest = [gpu_values[field_id][-1] for field_id in (
+                dcgm_fields.DCGM_FI_DEV_FB_TOTAL,
+                dcgm_fields.DCGM_FI_DEV_FB_USED,
+                dcgm_fields.DCGM_FI_DEV_GPU_UTIL,
+                dcgm_fields.DCGM_FI_DEV_MEM_COPY_UTIL,
+            )]
+        except (KeyError, IndexError):
+            return None
+        if any(v.isBlank for v in latest):
+            return None
+
+        # DCGM显存字段单位为MiB
+        total_memory = latest[0].value * 1024 * 1024
+        used_memory = latest[1].value * 1024 * 1024
+        return total_memory, used_memory, total_memory - used_memory, latest[2].value, latest[3].value
+
+    def _query_memory_info(self, handle):
+        """查询显存信息，返回的结构体在下次查询时会被覆盖"""
+        if self._fn_memory_info is None:
+            return pynvml.nvmlDeviceGetMemoryInfo(handle)
+        ret = self._fn_memory_info(handle, ctypes.byref(self._mem))
+        if ret != pynvml.NVML_SUCCESS:
+            raise pynvml.NVMLError(ret)
+        return self._mem
+
+    def _query_utilization(self, handle):
+        """查询利用率，返回的结构体在下次查询时会被覆盖"""
+        if self._fn_utilization is None:
+            return pynvml.nvmlDeviceGetUtilizationRates(handle)
+        ret = self._fn_utilization(handle, ctypes.byref(self._util))
+        if ret != pynvml.NVML_SUCCESS:
+            raise pynvml.NVMLError(ret)
+        return self._util
+
+    def _poll_loop(self):
+        """后台轮询线程，按固定间隔刷新GPU快照"""
+        while not self._stop:
+            self._wake.wait(self._ttl)
+            self._wake.clear()
+            if self._stop:
+                break
+            try:
+                # 引用赋值在GIL下是原子的，读取方无需加锁
+                self._snapshot = self._build_snapshot()
+            except Exception as e:
+                logging.error(f"GPU状态轮询失败: {e}")
+                continue
+            for callback in list(self._refresh_listeners):
+                try:
+                    callback()
+                except Exception as e:
+                    logging.error(f"GPU快照刷新回调失败: {e}")
+
+    def add_refresh_listener(self, callback: Callable[[], None]):
+        """注册快照刷新回调，回调在轮询线程中执行，应尽快返回"""
+        self._refresh_listeners.append(callback)
 
     def get_gpu_info(self) -> List[Dict]:
-        """获取所有GPU的详细信息"""
+        """获取所有GPU的详细信息（返回后台线程维护的最新快照）"""
+        return self._snapshot
+
+    def _build_snapshot(self) -> List[Dict]:
+        """查询DCGM或NVML，构建所有GPU的状态快照"""
         gpu_info = []
 
-        for i in range(self.device_count):
+        dcgm_values = None
+        if self._dcgm_group is not None:
             try:
-                handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-                name = pynvml.nvmlDeviceGetName(handle)
-                memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-                utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+                dcgm_values = self._dcgm_group.samples.GetLatest(self._dcgm_fields).values
+            except Exception as e:
+                logging.error(f"读取DCGM指标失败: {e}")
+
+        for i, handle in enumerate(self._handles):
+            try:
+                metrics = self._read_dcgm_metrics(dcgm_values, i) if dcgm_values is not None else None
+                if metrics is not None:
+                    total_memory, used_memory, free_memory, gpu_utilization, memory_utilization = metrics
+                else:
+                    memory_info = self._query_memory_info(handle)
+                    total_memory, used_memory, free_memory = memory_info.total, memory_info.used, memory_info.free
+                    gpu_utilization, memory_utilization = self._read_utilization(i, handle)
 
                 gpu_info.append({
                     'index': i,
-                    'name': name.decode('utf-8'),
-                    'total_memory': memory_info.total,
-                    'used_memory': memory_info.used,
-                    'free_memory': memory_info.free,
-                    'gpu_utilization': utilization.gpu,
-                    'memory_utilization': utilization.memory,
-                    'is_available': self._is_gpu_available(memory_info, utilization)
+                    'name': self._names[i],
+                    'total_memory': total_memory,
+                    'used_memory': used_memory,
+                    'free_memory': free_memory,
+                    'gpu_utilization': gpu_utilization,
+                    'memory_utilization': memory_utilization,
+                    'is_available': self._is_gpu_available(used_memory, total_memory, gpu_utilization)
                 })
             except Exception as e:
                 logging.error(f"获取GPU {i} 信息失败: {e}")
                 gpu_info.append({
                     'index': i,
-                    'name': 'Unknown',
+                    'name': self._names[i],
                     'total_memory': 0,
                     'used_memory': 0,
                     'free_memory': 0,
@@ -52,31 +220,62 @@ class GPUMonitor:
 
         return gpu_info
 
-    def get_available_gpus(self) -> List[int]:
-        """获取可用的GPU索引列表"""
-        gpu_info = self.get_gpu_info()
-        available_gpus = []
+    def _read_utilization(self, index: int, handle) -> Tuple[int, int]:
+        """读取GPU和显存利用率
+
+        优先通过nvmlDeviceGetSamples一次取回上次查询以来的全部采样并取最大值，
+        没有新采样或驱动不支持时回退到nvmlDeviceGetUtilizationRates
+        """
+        get_samples = getattr(pynvml, 'nvmlDeviceGetSamples', None)
+        if get_samples is not None:
+            try:
+                last_seen = self._last_seen[index]
+                _, gpu_samples = get_samples(handle, pynvml.NVML_GPU_UTILIZATION_SAMPLES, last_seen)
+                _, mem_samples = get_samples(handle, pynvml.NVML_MEMORY_UTILIZATION_SAMPLES, last_seen)
+                if gpu_samples and mem_samples:
+                    self._last_seen[index] = max(s.timeStamp for s in gpu_samples)
+                    return (max(s.sampleValue.uiVal for s in gpu_samples),
+                            max(s.sampleValue.uiVal for s in mem_samples))
+            except pynvml.NVMLError as e:
+                if e.value != pynvml.NVML_ERROR_NOT_FOUND:
+                    raise
+
+        utilization = self._query_utilization(handle)
+        return utilization.gpu, utilization.memory
 
-        for gpu in gpu_info:
-            if gpu['is_available']:
-                available_gpus.append(gpu['index'])
+    def invalidate(self):
+        """唤醒轮询线程立即刷新快照（如调度决策之后）"""
+        self._wake.set()
 
-        return available_gpus
+    def stop(self):
+        """停止后台轮询线程"""
+        self._stop = True
+        self._wake.set()
+        if self._poll_thread and self._poll_thread is not threading.current_thread():
+            self._poll_thread.join(timeout=5)
+
+    def acquire_gpus(self, required_count: int) -> Tuple[bool, List[int]]:
+        """一次遍历快照，返回(可用GPU是否足够, 最多required_count个可用GPU索引)"""
+        available_gpus = [gpu['index'] for gpu in self.get_gpu_info() if gpu['is_available']]
+        return len(available_gpus) >= required_count, available_gpus[:required_count]
+
+    def get_available_gpus(self) -> List[int]:
+        """获取可用的GPU索引列表"""
+        return self.acquire_gpus(self.device_count)[1]
 
     def get_available_gpu_count(self) -> int:
         """获取可用GPU数量"""
         return len(self.get_available_gpus())
 
-    def _is_gpu_available(self, memory_info, utilization) -> bool:
+    def _is_gpu_available(self, used_memory: int, total_memory: int, gpu_utilization: int) -> bool:
         """判断GPU是否可用"""
         # GPU利用率低于10%且内存使用率低于20%认为可用
-        return (utilization.gpu < 10 and
-                (memory_info.used / memory_info.total) < 0.2)
+        return (gpu_utilization < 10 and
+                (used_memory / total_memory) < 0.2)
 
     def check_gpu_availability(self, required_count: int) -> bool:
         """检查是否有足够的可用GPU"""
-        available_count = self.get_available_gpu_count()
-        return available_count >= required_count
+        return self.acquire_gpus(required_count)[0]
 
     def get_gpu_status_summary(self) -> Dict:
         """获取GPU状态摘要"""
@@ -93,6 +292,7 @@ class GPUMonitor:
     def __del__(self):
         """清理资源"""
         try:
+            self.stop()
             pynvml.nvmlShutdown()
         except:
             pass
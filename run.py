@@ -25,15 +25,11 @@ logging.basicConfig(
 def main():
     """主函数"""
     try:
-        from web_app import app, scheduler
+        from web_app import scheduler, run_server
         
-        # 启动调度器
-        scheduler.start()
-        logging.info("调度器已启动")
-        
-        # 启动Web应用
+        # 启动Web应用，调度器随服务启动
         logging.info("启动Web应用...")
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        run_server()
         
     except KeyboardInterrupt:
         logging.info("收到中断信号，正在关闭...")
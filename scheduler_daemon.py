@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+独立调度器进程
+
+调度器运行在单独的进程中，系统状态快照写入共享内存供Web进程直接读取，
+提交、取消、启停、配置等控制命令通过multiprocessing.connection发送。
+Web进程设置环境变量SCHEDULER_DAEMON=1后使用SchedulerClient连接本进程，
+此时可以启动多个Web worker而不会产生多份调度器。
+控制连接的认证密钥取自环境变量SCHEDULER_AUTHKEY，未设置时由调度器进程生成到
+SCHEDULER_AUTHKEY_FILE(默认~/.gpu_scheduler_authkey，权限0600)，Web进程需以同一用户运行。
+"""
+
+import os
+import stat
+import time
+import struct
+import secrets
+import signal
+import sys
+import logging
+import threading
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Listener, Client
+from typing import Callable, Dict, List, Optional
+
+import orjson
+
+# 共享内存名称和控制端口，Web进程与调度器进程需保持一致
+STATUS_SHM_NAME = os.getenv('SCHEDULER_SHM_NAME', 'gpu_sched_status')
+CONTROL_ADDRESS = (os.getenv('SCHEDULER_HOST', '127.0.0.1'), int(os.getenv('SCHEDULER_PORT', '5001')))
+
+# 控制连接的认证密钥文件，未设置SCHEDULER_AUTHKEY时由调度器进程生成，仅属主可读写
+AUTHKEY_FILE = os.getenv('SCHEDULER_AUTHKEY_FILE', os.path.expanduser('~/.gpu_scheduler_authkey'))
+
+# 共享内存大小，状态快照只包含系统状态摘要，1MiB足够
+_SHM_SIZE = 1024 * 1024
+
+# 共享内存头部: 写入序号(写入过程中为奇数)、快照长度、调度器进程启动标识、调度器状态版本号
+_HEADER = struct.Struct('<QIQQ')
+
+# 共享内存已废弃的序号标记，调度器进程关闭或被新进程替换时写入，客户端读到后重新打开共享内存
+_CLOSED_SEQ = 0xFFFFFFFFFFFFFFFF
+
+# 读取状态快照时等待写入完成的最长时间（秒），超时说明写入方已异常退出
+_READ_TIMEOUT = 0.05
+
+# 没有调度器事件时重新发布状态的间隔（秒），用于反映GPU利用率等变化
+_PUBLISH_INTERVAL = 1.0
+
+# 客户端检查状态序号变化的间隔（秒）
+_WATCH_INTERVAL = 0.2
+
+# 允许通过控制连接调用的命令
+_COMMANDS = frozenset((
+    'submit_task', 'get_task_status', 'get_tasks_status', 'get_all_tasks', 'cancel_task',
+    'start', 'stop', 'get_config', 'set_config', 'notify_listeners',
+))
+
+
+def _load_authkey(create: bool = False) -> bytes:
+    """读取控制连接的认证密钥：优先使用SCHEDULER_AUTHKEY，否则读取密钥文件，create为True时文件不存在则生成
+
+    密钥文件必须属于当前用户且不能被其他用户访问，控制连接传输pickle数据，密钥泄露等同于允许执行任意代码
+    """
+    authkey = os.getenv('SCHEDULER_AUTHKEY')
+    if authkey:
+        return authkey.encode('utf-8')
+
+    if create:
+        try:
+            fd = os.open(AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+            logging.info(f"已生成控制连接认证密钥: {AUTHKEY_FILE}")
+
+    try:
+        fd = os.open(AUTHKEY_FILE, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    except FileNotFoundError:
+        raise RuntimeError(f"未设置SCHEDULER_AUTHKEY且认证密钥文件不存在: {AUTHKEY_FILE}") from None
+    with os.fdopen(fd) as f:
+        st = os.fstat(f.fileno())
+        if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+            raise RuntimeError(f"认证密钥文件必须属于当前用户且权限为0600: {AUTHKEY_FILE}")
+        authkey = f.read().strip()
+    if not authkey:
+        raise RuntimeError(f"认证密钥文件为空: {AUTHKEY_FILE}")
+    return authkey.encode('utf-8')
+
+
+def _attach_status() -> shared_memory.SharedMemory:
+    """打开调度器进程创建的共享内存，调度器进程未启动时抛出FileNotFoundError"""
+    # 共享内存归调度器进程所有，客户端退出时不能被resource_tracker删除
+    try:
+        return shared_memory.SharedMemory(name=STATUS_SHM_NAME, track=False)
+    except TypeError:
+        # Python 3.13之前没有track参数
+        shm = shared_memory.SharedMemory(name=STATUS_SHM_NAME)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _read_status(buf) -> Optional[tuple]:
+    """读取共享内存中的状态快照，返回(状态版本, 快照bytes)；写入过程中读到的数据会被丢弃重读，
+    共享内存已废弃或写入超时未完成时返回None
+
+    状态版本由启动标识(高位)和调度器的state_version组成，调度器进程重启后不会与之前的版本相同
+    """
+    deadline = None
+    while True:
+        seq, length, boot_id, version = _HEADER.unpack_from(buf, 0)
+        if seq == _CLOSED_SEQ:
+            return None
+        if seq & 1:
+            if deadline is None:
+                deadline = time.monotonic() + _READ_TIMEOUT
+            elif time.monotonic() >= deadline:
+                return None
+            time.sleep(0)
+            continue
+        data = bytes(buf[_HEADER.size:_HEADER.size + length])
+        if _HEADER.unpack_from(buf, 0)[0] == seq:
+            return (boot_id << 64) | version, data
+
+
+def _mark_closed(shm: shared_memory.SharedMemory):
+    """标记共享内存已废弃，仍在读取的客户端据此重新打开新的共享内存"""
+    _HEADER.pack_into(shm.buf, 0, _CLOSED_SEQ, 0, 0, 0)
+
+
+class SchedulerDaemon:
+    """在独立进程中托管TaskScheduler，发布状态快照并处理控制命令
+
+    创建前必须已绑定控制地址：同名共享内存只有在确认没有其他调度器进程运行时才能当作遗留数据接管
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+        try:
+            self._shm = shared_memory.SharedMemory(name=STATUS_SHM_NAME, create=True, size=_SHM_SIZE)
+        except FileExistsError:
+            # 上次进程异常退出遗留的共享内存
+            stale = shared_memory.SharedMemory(name=STATUS_SHM_NAME)
+            _mark_closed(stale)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=STATUS_SHM_NAME, create=True, size=_SHM_SIZE)
+
+        self._seq = 0
+        # 每次启动随机生成，客户端据此区分重启前后的状态版本
+        self._boot_id = secrets.randbits(63)
+        self._last_blob = None
+        self._last_version = None
+        self._changed = threading.Event()
+        scheduler.add_listener(lambda version: self._changed.set())
+        self._publish()
+
+    def _publish(self):
+        """序列化系统状态写入共享内存，状态摘要和调度器状态版本都未变化时不写入
+
+        任务列表的变化不一定改变状态摘要(如任务数量不变)，版本号变化时同样需要发布，供客户端判断任务列表缓存是否失效
+        """
+        # 先读取版本号再构建快照，构建期间发生的变化会在下次发布时体现
+        version = self.scheduler.state_version
+        blob = orjson.dumps(self.scheduler.get_system_status())
+        if blob == self._last_blob and version == self._last_version:
+            return
+        if _HEADER.size + len(blob) > _SHM_SIZE:
+            logging.error(f"状态快照过大，无法写入共享内存: {len(blob)} bytes")
+            return
+
+        buf = self._shm.buf
+        _HEADER.pack_into(buf, 0, self._seq + 1, 0, 0, 0)
+        buf[_HEADER.size:_HEADER.size + len(blob)] = blob
+        self._seq += 2
+        _HEADER.pack_into(buf, 0, self._seq, len(blob), self._boot_id, version)
+        self._last_blob = blob
+        self._last_version = version
+
+    def _publish_loop(self):
+        while True:
+            self._changed.wait(_PUBLISH_INTERVAL)
+            self._changed.clear()
+            try:
+                self._publish()
+            except Exception as e:
+                logging.error(f"发布调度器状态失败: {e}")
+
+    def _dispatch(self, method: str, args: tuple):
+        if method not in _COMMANDS:
+            raise ValueError(f"未知命令: {method}")
+        if method == 'get_config':
+            return {
+                'retry_interval': self.scheduler.retry_interval,
+                'idle_interval': self.scheduler.idle_interval,
+                'error_interval': self.scheduler.error_interval
+            }
+        if method == 'set_config':
+            for name, value in args[0].items():
+                if name in ('retry_interval', 'idle_interval', 'error_interval'):
+                    setattr(self.scheduler, name, value)
+            return None
+        return getattr(self.scheduler, method)(*args)
+
+    def _handle_connection(self, conn):
+        """处理一个客户端连接上的命令，直到客户端断开"""
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(('ok', self._dispatch(method, args)))
+                except Exception as e:
+                    conn.send(('error', str(e)))
+
+    def serve_forever(self, listener: Listener):
+        """发布状态并在已绑定的listener上接受控制连接，阻塞直到进程退出"""
+        threading.Thread(target=self._publish_loop, daemon=True).start()
+        logging.info(f"调度器进程已就绪 - 控制地址: {CONTROL_ADDRESS[0]}:{CONTROL_ADDRESS[1]}, 共享内存: {STATUS_SHM_NAME}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logging.warning(f"接受控制连接失败: {e}")
+                continue
+            threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+
+    def close(self):
+        """释放共享内存"""
+        _mark_closed(self._shm)
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _config_property(name: str):
+    """调度器配置项的代理属性，读写都通过控制连接完成"""
+    def getter(self):
+        return self._call('get_config')[name]
+
+    def setter(self, value):
+        self._call('set_config', {name: value})
+
+    return property(getter, setter)
+
+
+class SchedulerClient:
+    """调度器进程的客户端，提供与TaskScheduler相同的接口供Web进程使用"""
+
+    retry_interval = _config_property('retry_interval')
+    idle_interval = _config_property('idle_interval')
+    error_interval = _config_property('error_interval')
+
+    def __init__(self):
+        # 调度器进程未启动时抛出FileNotFoundError
+        self._shm = _attach_status()
+        self._shm_lock = threading.Lock()
+        self._authkey = _load_authkey()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[int], None]] = []
+        self._watcher = None
+
+    def _call(self, method: str, *args):
+        """发送命令并等待结果，调度器进程中的异常以RuntimeError抛出"""
+        with self._lock:
+            while True:
+                reused = self._conn is not None
+                if not reused:
+                    self._conn = Client(CONTROL_ADDRESS, authkey=self._authkey)
+                try:
+                    self._conn.send((method, args))
+                    status, result = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    # 复用的连接已断开(如调度器进程重启)时重新连接并重试一次，新建的连接失败时直接抛出
+                    self._conn = None
+                    if not reused:
+                        raise
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def _status(self) -> tuple:
+        """读取状态快照；共享内存已废弃(调度器进程重启)或写入方中途退出时重新打开一次"""
+        with self._shm_lock:
+            result = _read_status(self._shm.buf)
+            if result is None:
+                try:
+                    shm = _attach_status()
+                except FileNotFoundError:
+                    shm = None
+                if shm is not None:
+                    self._shm.close()
+                    self._shm = shm
+                    result = _read_status(shm.buf)
+        if result is None:
+            raise RuntimeError("无法读取调度器状态，调度器进程可能已退出")
+        return result
+
+    @property
+    def state_version(self) -> int:
+        """调度器状态版本，调度器进程重启后与之前的任何版本都不相同"""
+        return self._status()[0]
+
+    def get_system_status(self) -> Dict:
+        """从共享内存读取系统状态，不经过控制连接"""
+        return orjson.loads(self._status()[1])
+
+    def get_config(self) -> Dict:
+        """一次调用读取全部配置项"""
+        return self._call('get_config')
+
+    def submit_task(self, script_path: str, priority: int = 0) -> str:
+        return self._call('submit_task', script_path, priority)
+
+    def get_task_status(self, task_id: str) -> Optional[Dict]:
+        return self._call('get_task_status', task_id)
+
+    def get_tasks_status(self, task_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        return self._call('get_tasks_status', task_ids)
+
+    def get_all_tasks(self) -> Dict:
+        return self._call('get_all_tasks')
+
+    def cancel_task(self, task_id: str) -> bool:
+        return self._call('cancel_task', task_id)
+
+    def start(self):
+        self._call('start')
+
+    def stop(self):
+        self._call('stop')
+
+    def notify_listeners(self):
+        self._call('notify_listeners')
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """注册状态变化监听器，共享内存中的状态序号变化时在后台线程中回调"""
+        self._listeners.append(callback)
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_loop, daemon=True)
+            self._watcher.start()
+
+    def remove_listener(self, callback: Callable[[int], None]):
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    def _watch_loop(self):
+        last = None
+        while True:
+            try:
+                version = self.state_version
+            except RuntimeError:
+                # 调度器进程不可用，等待其重新启动
+                version = last
+            if last is not None and version != last:
+                for callback in list(self._listeners):
+                    try:
+                        callback(version)
+                    except Exception as e:
+                        logging.error(f"状态监听器回调失败: {e}")
+            last = version
+            time.sleep(_WATCH_INTERVAL)
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # 先绑定控制地址，已有调度器进程在运行时直接退出，不接管其共享内存，也不启动第二个调度器
+    try:
+        listener = Listener(CONTROL_ADDRESS, authkey=_load_authkey(create=True))
+    except OSError as e:
+        logging.error(f"无法绑定控制地址 {CONTROL_ADDRESS[0]}:{CONTROL_ADDRESS[1]}，调度器进程可能已在运行: {e}")
+        sys.exit(1)
+
+    from task_scheduler import TaskScheduler
+
+    with listener:
+        scheduler = TaskScheduler(
+            retry_interval=5,    # 重试间隔5秒
+            idle_interval=1,     # 空闲间隔1秒
+            error_interval=5     # 错误间隔5秒
+        )
+        scheduler.start()
+        daemon = SchedulerDaemon(scheduler)
+        # SIGTERM与Ctrl+C一样走正常关闭流程，确保共享内存被释放
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            daemon.serve_forever(listener)
+        except KeyboardInterrupt:
+            logging.info("收到中断信号，正在关闭...")
+        finally:
+            scheduler.stop()
+            daemon.close()
+            logging.info("调度器进程已关闭")
+
+
+if __name__ == '__main__':
+    main()
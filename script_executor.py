@@ -1,27 +1,110 @@
-import subprocess
+import asyncio
+import atexit
+import functools
 import os
+import queue
+import shutil
 import signal
+import subprocess
+import sys
 import time
 import logging
-from typing import Dict, List, Optional
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import threading
+from collections import defaultdict, deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
 from datetime import datetime
 
+# 扩展名映射和shebang正则与脚本解析模块共用，两处判断结果保持一致
+from script_parser import _EXT_MAP, _SHEBANG_RE
+
+# 解释器绝对路径在模块加载时解析一次，子进程启动时无需再按PATH逐个查找
+_PYTHON = shutil.which('python') or shutil.which('python3') or sys.executable
+_BASH = shutil.which('bash') or '/bin/bash'
+
+# 脚本类型缓存的最大条目数
+_TYPE_CACHE_SIZE = 1024
+
+# 返回结果中保留的输出末尾行数
+_OUTPUT_TAIL_LINES = 256
+
+# 子进程输出单行的读取上限
+_STREAM_LIMIT = 1024 * 1024
+
+# running_processes的分段锁数量，必须为2的幂
+_LOCK_STRIPES = 16
+
+# 脚本日志队列及写文件的监听线程，多个ScriptExecutor实例共享
+_log_queue = queue.SimpleQueue()
+_script_listener = None
+
+
+@dataclass(slots=True)
+class ProcEntry:
+    """正在运行的脚本进程记录"""
+    process: subprocess.Popen
+    script_path: str
+    script_type: str
+    start_time: float
+    exited: asyncio.Future
+
+
+@functools.lru_cache(maxsize=64)
+def _cuda_visible_devices(gpu_indices: Tuple[int, ...]) -> str:
+    """GPU索引元组转换为CUDA_VISIBLE_DEVICES的值，常用的GPU组合复用同一个字符串"""
+    return ','.join(map(str, gpu_indices))
+
+
+class ProcessInfo(NamedTuple):
+    """对外暴露的进程信息"""
+    script_path: str
+    script_type: str
+    start_time: float
+    running_time: float
+
 
 class ScriptExecutor:
     """脚本执行器，安全地执行shell和python脚本"""
 
-    def __init__(self):
-        self.running_processes = {}
-        self.process_lock = threading.Lock()
+    def __init__(self, max_concurrency_per_gpu: int = 1):
+        self.running_processes: Dict[int, ProcEntry] = {}
+        # 按PID分段加锁，不同进程的登记、查询和终止互不阻塞
+        self._stripes = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._type_cache: Dict[Tuple[str, float], str] = {}
+
+        # 每个GPU上允许同时运行的脚本数，多个任务共用同一GPU时互相拖慢，默认串行
+        self.max_concurrency_per_gpu = max_concurrency_per_gpu
+        self._gpu_slots: Dict[int, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.max_concurrency_per_gpu))
+
+        # 所有子进程的输出读取和退出等待都在同一个事件循环线程中完成
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
 
         # 创建脚本日志记录器
         self.script_logger = self._setup_script_logger()
 
+    def _lock_for(self, pid: int) -> threading.Lock:
+        """获取PID所在分段的锁"""
+        return self._stripes[pid & (_LOCK_STRIPES - 1)]
+
     def _setup_script_logger(self):
-        """设置脚本专用日志记录器"""
+        """设置脚本专用日志记录器，文件处理器在进程内只创建一次
+
+        日志记录只是放入队列，由后台QueueListener线程写入文件，避免磁盘I/O阻塞调用方
+        """
+        global _script_listener
         script_logger = logging.getLogger('script_executor')
+        if _script_listener is not None:
+            return script_logger
+
         script_logger.setLevel(logging.INFO)
+        # 脚本输出只写入脚本日志文件，不传递到根日志记录器的控制台和系统日志文件；
+        # 执行事件由_log_script_execution另行写入系统日志
+        script_logger.propagate = False
 
         # 创建logs目录
         os.makedirs('logs', exist_ok=True)
@@ -39,46 +122,75 @@ class ScriptExecutor:
         )
         file_handler.setFormatter(formatter)
 
-        script_logger.addHandler(file_handler)
+        _script_listener = QueueListener(_log_queue, file_handler, respect_handler_level=True)
+        _script_listener.start()
+        atexit.register(_script_listener.stop)
+
+        script_logger.addHandler(QueueHandler(_log_queue))
         return script_logger
 
-    def _log_script_execution(self, script_path: str, script_type: str, action: str, details: str = ""):
-        """记录脚本执行日志"""
+    def _log_script_execution(self, script_path: str, script_type: str, action: str, details: str = "",
+                              system: bool = True):
+        """记录脚本执行日志，system为True时同时写入系统日志"""
         log_message = f"[{script_type.upper()}] {action}: {script_path}"
         if details:
             log_message += f" - {details}"
         self.script_logger.info(log_message)
+        if system:
+            logging.info(log_message)
 
     def _get_script_type(self, script_path: str) -> str:
         """判断脚本类型"""
         _, ext = os.path.splitext(script_path)
-        if ext.lower() in ['.py', '.python']:
-            return 'python'
-        elif ext.lower() in ['.sh', '.bash', '.zsh', '']:
-            return 'shell'
-        else:
-            # 检查文件头部来判断类型
-            try:
-                with open(script_path, 'r', encoding='utf-8') as f:
-                    first_line = f.readline().strip()
-                    if first_line.startswith('#!'):
-                        if 'python' in first_line:
-                            return 'python'
-                        elif any(shell in first_line for shell in ['bash', 'sh', 'zsh']):
-                            return 'shell'
-            except:
-                pass
+        script_type = _EXT_MAP.get(ext.lower())
+        if script_type is not None:
+            return script_type
+
+        # 检查文件头部来判断类型，按(路径, 修改时间)缓存避免重复读取文件
+        try:
+            key = (script_path, os.path.getmtime(script_path))
+        except OSError:
             return 'shell'  # 默认为shell
+        script_type = self._type_cache.get(key)
+        if script_type is None:
+            try:
+                with open(script_path, 'rb') as f:
+                    head = f.read(128)
+                script_type = 'python' if _SHEBANG_RE.match(head) else 'shell'
+            except OSError:
+                script_type = 'shell'
+            if len(self._type_cache) >= _TYPE_CACHE_SIZE:
+                self._type_cache.clear()
+            self._type_cache[key] = script_type
+        return script_type
 
     def _get_execution_command(self, script_path: str, script_type: str) -> List[str]:
         """获取执行命令"""
         if script_type == 'python':
-            return ['python', script_path]
+            return [_PYTHON, script_path]
         else:
-            return ['bash', script_path]
+            return [_BASH, script_path]
 
     def execute_script(self, script_path: str, gpu_indices: List[int] = None) -> Dict:
-        """执行脚本"""
+        """执行脚本（同步接口，在事件循环线程中执行）"""
+        return self._run_sync(self.execute_script_async(script_path, gpu_indices))
+
+    def execute_script_with_timeout(self, script_path: str, gpu_indices: List[int] = None,
+                                    timeout: int = 3600) -> Dict:
+        """带超时的脚本执行（同步接口，在事件循环线程中执行）"""
+        return self._run_sync(self.execute_script_async(script_path, gpu_indices, timeout))
+
+    def _run_sync(self, coro):
+        """将协程提交到事件循环线程并等待结果，不能在事件循环线程内调用"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def execute_script_async(self, script_path: str, gpu_indices: List[int] = None,
+                                   timeout: Optional[float] = None) -> Dict:
+        """执行脚本，多个脚本共享同一个事件循环线程等待输出和退出"""
+        # 带超时的执行使用TIMEOUT_前缀的日志事件
+        prefix = 'TIMEOUT_' if timeout is not None else ''
+        # 日志级别过滤掉INFO时跳过日志参数的格式化
+        log_info = self.script_logger.isEnabledFor(logging.INFO)
         try:
             # 验证脚本文件
             if not os.path.exists(script_path):
@@ -99,168 +211,81 @@ class ScriptExecutor:
 
             # 判断脚本类型
             script_type = self._get_script_type(script_path)
-            self._log_script_execution(script_path, script_type, 'SCRIPT_TYPE_DETECTED')
-            logging.info(f"检测到脚本类型: {script_type}")
-
-            # 设置环境变量
-            env = os.environ.copy()
-            if gpu_indices:
-                env['CUDA_VISIBLE_DEVICES'] = ','.join(map(str, gpu_indices))
-                gpu_info = f"GPU: {gpu_indices}"
-                self._log_script_execution(script_path, script_type, 'GPU_ASSIGNED', gpu_info)
-                logging.info(f"设置CUDA_VISIBLE_DEVICES: {env['CUDA_VISIBLE_DEVICES']}")
-
-            # 获取执行命令
-            cmd = self._get_execution_command(script_path, script_type)
-            self._log_script_execution(script_path, script_type, 'EXECUTION_STARTED', f"CMD: {' '.join(cmd)}")
-
-            # 执行脚本
-            process = subprocess.Popen(
-                cmd,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                encoding='utf-8',
-                errors='replace'
-            )
-
-            # 记录进程
-            process_id = f"process_{process.pid}"
-            start_time = time.time()
-            with self.process_lock:
-                self.running_processes[process_id] = {
-                    'process': process,
-                    'script_path': script_path,
-                    'script_type': script_type,
-                    'start_time': start_time
-                }
-
-            self._log_script_execution(script_path, script_type, 'PROCESS_STARTED', f"PID: {process.pid}")
-            logging.info(f"开始执行{script_type}脚本: {script_path}, PID: {process.pid}")
-
-            # 获取输出
-            output, _ = process.communicate()
-            exit_code = process.returncode
-            execution_time = time.time() - start_time
-
-            # 清理进程记录
-            with self.process_lock:
-                if process_id in self.running_processes:
-                    del self.running_processes[process_id]
-
-            # 记录执行结果
-            if exit_code == 0:
-                self._log_script_execution(script_path, script_type, 'EXECUTION_SUCCESS',
-                                         f"Exit: {exit_code}, Time: {execution_time:.2f}s")
-                logging.info(f"{script_type}脚本执行成功: {script_path}")
-
-                # 记录输出摘要
-                output_lines = output.strip().split('\n')
-                if output_lines:
-                    self._log_script_execution(script_path, script_type, 'OUTPUT_SUMMARY',
-                                             f"Lines: {len(output_lines)}, First: {output_lines[0][:50]}")
-
-                return {
-                    'success': True,
-                    'output': output,
-                    'exit_code': exit_code,
-                    'script_type': script_type,
-                    'execution_time': execution_time
-                }
-            else:
-                self._log_script_execution(script_path, script_type, 'EXECUTION_FAILED',
-                                         f"Exit: {exit_code}, Time: {execution_time:.2f}s")
-                logging.error(f"{script_type}脚本执行失败: {script_path}, 退出码: {exit_code}")
-
-                return {
-                    'success': False,
-                    'error': f'{script_type}脚本执行失败，退出码: {exit_code}',
-                    'output': output,
-                    'exit_code': exit_code,
-                    'script_type': script_type,
-                    'execution_time': execution_time
-                }
-
-        except Exception as e:
-            self._log_script_execution(script_path, 'unknown', 'EXECUTION_ERROR', str(e))
-            logging.error(f"执行脚本时发生错误: {script_path}, {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'output': '',
-                'script_type': 'unknown'
-            }
-
-    def execute_script_with_timeout(self, script_path: str, gpu_indices: List[int] = None,
-                                    timeout: int = 3600) -> Dict:
-        """带超时的脚本执行"""
-        try:
-            # 验证脚本文件
-            if not os.path.exists(script_path):
-                self._log_script_execution(script_path, 'unknown', 'FILE_NOT_FOUND')
-                return {
-                    'success': False,
-                    'error': f'脚本文件不存在: {script_path}',
-                    'output': ''
-                }
-
-            # 判断脚本类型
-            script_type = self._get_script_type(script_path)
-            self._log_script_execution(script_path, script_type, 'TIMEOUT_EXECUTION_STARTED', f"Timeout: {timeout}s")
+            if log_info:
+                if timeout is not None:
+                    self._log_script_execution(script_path, script_type, 'TIMEOUT_EXECUTION_STARTED', f"Timeout: {timeout}s")
+                else:
+                    self._log_script_execution(script_path, script_type, 'SCRIPT_TYPE_DETECTED')
 
-            # 设置环境变量
-            env = os.environ.copy()
+            # 设置环境变量，未指定GPU时直接继承父进程环境，不复制os.environ
+            env = None
             if gpu_indices:
-                env['CUDA_VISIBLE_DEVICES'] = ','.join(map(str, gpu_indices))
+                env = {**os.environ, 'CUDA_VISIBLE_DEVICES': _cuda_visible_devices(tuple(gpu_indices))}
+                if log_info:
+                    self._log_script_execution(script_path, script_type, 'GPU_ASSIGNED', f"GPU: {gpu_indices}")
 
             # 获取执行命令
             cmd = self._get_execution_command(script_path, script_type)
+            if log_info and timeout is None:
+                self._log_script_execution(script_path, script_type, 'EXECUTION_STARTED', f"CMD: {' '.join(cmd)}")
+
+            # 同一GPU上的任务串行执行，按GPU编号顺序获取避免死锁
+            async with AsyncExitStack() as gpu_stack:
+                for gpu_index in sorted(set(gpu_indices or [])):
+                    await gpu_stack.enter_async_context(self._gpu_slots[gpu_index])
+
+                # 执行脚本
+                process, stdout, exited = await self._spawn(cmd, env)
+
+                # 记录进程
+                process_id = process.pid
+                start_time = time.time()
+                with self._lock_for(process_id):
+                    self.running_processes[process_id] = ProcEntry(process, script_path, script_type, start_time, exited)
+
+                if log_info:
+                    self._log_script_execution(script_path, script_type, f'{prefix}PROCESS_STARTED', f"PID: {process.pid}")
+
+                # 输出逐行写入脚本日志，内存中只保留末尾若干行
+                tail = deque(maxlen=_OUTPUT_TAIL_LINES)
+                try:
+                    # 等待进程完成，超时由事件循环的定时器处理
+                    line_count, first_line = await asyncio.wait_for(
+                        self._wait_with_output(stdout, exited, script_path, script_type, tail), timeout)
+                except asyncio.TimeoutError:
+                    # 超时，终止进程
+                    if log_info:
+                        self._log_script_execution(script_path, script_type, 'EXECUTION_TIMEOUT', f"Timeout: {timeout}s")
+                    logging.warning(f"{script_type}脚本执行超时: {script_path}, PID: {process.pid}")
+                    await self._terminate_process(process, exited, process_id)
 
-            # 执行脚本
-            process = subprocess.Popen(
-                cmd,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                encoding='utf-8',
-                errors='replace'
-            )
-
-            # 记录进程
-            process_id = f"process_{process.pid}"
-            start_time = time.time()
-            with self.process_lock:
-                self.running_processes[process_id] = {
-                    'process': process,
-                    'script_path': script_path,
-                    'script_type': script_type,
-                    'start_time': start_time
-                }
-
-            self._log_script_execution(script_path, script_type, 'TIMEOUT_PROCESS_STARTED', f"PID: {process.pid}")
-            logging.info(f"开始执行{script_type}脚本: {script_path}, PID: {process.pid}, 超时: {timeout}秒")
+                    return {
+                        'success': False,
+                        'error': f'{script_type}脚本执行超时 (>{timeout}秒)',
+                        'output': ''.join(tail),
+                        'timeout': True,
+                        'script_type': script_type
+                    }
 
-            try:
-                # 等待进程完成，带超时
-                output, _ = process.communicate(timeout=timeout)
+                output = ''.join(tail)
                 exit_code = process.returncode
                 execution_time = time.time() - start_time
 
                 # 清理进程记录
-                with self.process_lock:
-                    if process_id in self.running_processes:
-                        del self.running_processes[process_id]
+                with self._lock_for(process_id):
+                    self.running_processes.pop(process_id, None)
 
+                # 记录执行结果
                 if exit_code == 0:
-                    self._log_script_execution(script_path, script_type, 'TIMEOUT_EXECUTION_SUCCESS',
-                                             f"Exit: {exit_code}, Time: {execution_time:.2f}s")
-                    logging.info(f"{script_type}脚本执行成功: {script_path}")
+                    if log_info:
+                        self._log_script_execution(script_path, script_type, f'{prefix}EXECUTION_SUCCESS',
+                                                 f"Exit: {exit_code}, Time: {execution_time:.2f}s")
+
+                        # 记录输出摘要
+                        if timeout is None and line_count:
+                            self._log_script_execution(script_path, script_type, 'OUTPUT_SUMMARY',
+                                                     f"Lines: {line_count}, First: {first_line[:50]}")
+
                     return {
                         'success': True,
                         'output': output,
@@ -269,9 +294,11 @@ class ScriptExecutor:
                         'execution_time': execution_time
                     }
                 else:
-                    self._log_script_execution(script_path, script_type, 'TIMEOUT_EXECUTION_FAILED',
-                                             f"Exit: {exit_code}, Time: {execution_time:.2f}s")
+                    if log_info:
+                        self._log_script_execution(script_path, script_type, f'{prefix}EXECUTION_FAILED',
+                                                 f"Exit: {exit_code}, Time: {execution_time:.2f}s")
                     logging.error(f"{script_type}脚本执行失败: {script_path}, 退出码: {exit_code}")
+
                     return {
                         'success': False,
                         'error': f'{script_type}脚本执行失败，退出码: {exit_code}',
@@ -281,22 +308,8 @@ class ScriptExecutor:
                         'execution_time': execution_time
                     }
 
-            except subprocess.TimeoutExpired:
-                # 超时，终止进程
-                self._log_script_execution(script_path, script_type, 'EXECUTION_TIMEOUT', f"Timeout: {timeout}s")
-                logging.warning(f"{script_type}脚本执行超时: {script_path}, PID: {process.pid}")
-                self._terminate_process(process, process_id)
-
-                return {
-                    'success': False,
-                    'error': f'{script_type}脚本执行超时 (>{timeout}秒)',
-                    'output': '',
-                    'timeout': True,
-                    'script_type': script_type
-                }
-
         except Exception as e:
-            self._log_script_execution(script_path, 'unknown', 'TIMEOUT_EXECUTION_ERROR', str(e))
+            self._log_script_execution(script_path, 'unknown', f'{prefix}EXECUTION_ERROR', str(e))
             logging.error(f"执行脚本时发生错误: {script_path}, {e}")
             return {
                 'success': False,
@@ -305,7 +318,75 @@ class ScriptExecutor:
                 'script_type': 'unknown'
             }
 
-    def _terminate_process(self, process: subprocess.Popen, process_id: str):
+    async def _spawn(self, cmd: List[str], env: Optional[Dict[str, str]]
+                     ) -> Tuple[subprocess.Popen, asyncio.StreamReader, asyncio.Future]:
+        """启动子进程，返回(进程, 输出流, 退出Future)，输出和退出都由事件循环监听"""
+        loop = asyncio.get_running_loop()
+        process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        stdout = asyncio.StreamReader(limit=_STREAM_LIMIT, loop=loop)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stdout, loop=loop), process.stdout)
+        return process, stdout, self._watch_exit(process)
+
+    def _watch_exit(self, process: subprocess.Popen) -> asyncio.Future:
+        """通过pidfd监听进程退出，所有子进程共用事件循环的epoll，无需每个子进程一个等待线程"""
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            # Linux < 5.3 或非Linux平台不支持pidfd，退回到线程池中阻塞等待
+            return loop.run_in_executor(None, process.wait)
+
+        exited = loop.create_future()
+
+        def on_exit():
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+            if not exited.done():
+                # 进程已退出，wait()立即返回退出码
+                exited.set_result(process.wait())
+
+        loop.add_reader(pidfd, on_exit)
+        return exited
+
+    async def _wait_with_output(self, stdout: asyncio.StreamReader, exited: asyncio.Future, script_path: str,
+                                script_type: str, tail: deque) -> Tuple[int, str]:
+        """逐行读取进程输出直到结束并等待退出，返回(输出行数, 首行内容)"""
+        line_count = 0
+        first_line = ''
+        log_info = self.script_logger.isEnabledFor(logging.INFO)
+        # 正在丢弃超长行的剩余部分
+        skipping = False
+        while True:
+            try:
+                line = await stdout.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # 输出结束，最后一行可能没有换行符
+                line = e.partial
+            except asyncio.LimitOverrunError as e:
+                # 单行超过读取上限，丢弃已缓冲的部分，该行其余内容读到换行符为止一并丢弃
+                if not skipping:
+                    logging.warning(f"脚本输出行过长，已丢弃: {script_path}")
+                await stdout.readexactly(e.consumed)
+                skipping = True
+                continue
+            if not line:
+                break
+            if skipping:
+                skipping = False
+                continue
+            text = line.decode('utf-8', errors='replace')
+            if line_count == 0:
+                first_line = text.strip()
+            line_count += 1
+            tail.append(text)
+            if log_info:
+                self._log_script_execution(script_path, script_type, 'OUTPUT', text.rstrip('\n'), system=False)
+
+        await asyncio.shield(exited)
+        return line_count, first_line
+
+    async def _terminate_process(self, process: subprocess.Popen, exited: asyncio.Future, process_id: int):
         """终止进程"""
         try:
             # 发送SIGTERM信号
@@ -313,57 +394,49 @@ class ScriptExecutor:
 
             # 等待进程结束
             try:
-                process.wait(timeout=10)
-            except subprocess.TimeoutExpired:
+                await asyncio.wait_for(asyncio.shield(exited), 10)
+            except asyncio.TimeoutError:
                 # 强制杀死进程
                 logging.warning(f"强制终止进程: {process_id}")
                 process.kill()
-                process.wait()
-
-            # 清理进程记录
-            with self.process_lock:
-                if process_id in self.running_processes:
-                    del self.running_processes[process_id]
+                await exited
 
+        except ProcessLookupError:
+            # 进程已退出
+            pass
         except Exception as e:
             logging.error(f"终止进程时发生错误: {process_id}, {e}")
+        finally:
+            # 清理进程记录
+            with self._lock_for(process_id):
+                self.running_processes.pop(process_id, None)
 
-    def kill_process(self, process_id: str) -> bool:
-        """杀死指定进程"""
-        with self.process_lock:
-            if process_id not in self.running_processes:
-                return False
+    def kill_process(self, process_id: int) -> bool:
+        """杀死指定进程（process_id为进程PID）"""
+        with self._lock_for(process_id):
+            entry = self.running_processes.get(process_id)
+        if entry is None:
+            return False
 
-            process_info = self.running_processes[process_id]
-            process = process_info['process']
+        try:
+            self._run_sync(self._terminate_process(entry.process, entry.exited, process_id))
+            logging.info(f"进程已终止: {process_id}")
+            return True
+        except Exception as e:
+            logging.error(f"终止进程失败: {process_id}, {e}")
+            return False
 
-            try:
-                self._terminate_process(process, process_id)
-                logging.info(f"进程已终止: {process_id}")
-                return True
-            except Exception as e:
-                logging.error(f"终止进程失败: {process_id}, {e}")
-                return False
-
-    def get_running_processes(self) -> Dict:
-        """获取正在运行的进程信息"""
-        with self.process_lock:
-            processes = {}
-            for process_id, process_info in self.running_processes.items():
-                process = process_info['process']
-                processes[process_id] = {
-                    'script_path': process_info['script_path'],
-                    'script_type': process_info.get('script_type', 'unknown'),
-                    'pid': process.pid,
-                    'start_time': process_info['start_time'],
-                    'running_time': time.time() - process_info['start_time']
-                }
-            return processes
+    def get_running_processes(self) -> Dict[int, ProcessInfo]:
+        """获取正在运行的进程信息，以PID为键"""
+        now = time.time()
+        # 在GIL下复制条目快照，无需持有任何分段锁
+        entries = list(self.running_processes.items())
+        return {pid: ProcessInfo(entry.script_path, entry.script_type, entry.start_time, now - entry.start_time)
+                for pid, entry in entries}
 
     def kill_all_processes(self):
         """终止所有正在运行的进程"""
-        with self.process_lock:
-            process_ids = list(self.running_processes.keys())
+        process_ids = list(self.running_processes)
 
         for process_id in process_ids:
             self.kill_process(process_id)
@@ -1,36 +1,83 @@
 import re
 import os
-from typing import Dict, List, Optional, Tuple
+import functools
+from types import MappingProxyType
+from typing import Dict, Iterator, Optional, Tuple
 import logging
 
+# 支持多种GPU设置格式，合并为一个正则，每种格式的取值放在以格式命名的分组中
+# 各格式均为ASCII，直接在脚本原始字节上匹配，无需先解码整个文件
+_CUDA_RE = re.compile(
+    # CUDA_VISIBLE_DEVICES=0,1,2，取值截止到行尾，后续行中的数字不计入
+    rb"CUDA_VISIBLE_DEVICES\s*=\s*(?P<env>[0-9,\-\t ]+)"
+    # os.environ['CUDA_VISIBLE_DEVICES'] = '0,1,2'
+    rb"|os\.environ\[['\"]CUDA_VISIBLE_DEVICES['\"]\]\s*=\s*['\"](?P<os_env>[0-9,\-\s]+)['\"]"
+    # os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0,1,2')
+    rb"|os\.environ\.setdefault\(['\"]CUDA_VISIBLE_DEVICES['\"],\s*['\"](?P<setdefault>[0-9,\-\s]+)['\"]\)"
+    # torch.cuda.set_device(0)
+    rb"|torch\.cuda\.set_device\((?P<set_device>\d+)\)"
+    # device = torch.device('cuda:0')
+    rb"|torch\.device\(['\"]cuda:(?P<device>\d+)['\"]\)",
+    re.IGNORECASE
+)
+
+# 逗号分隔的单个GPU索引或索引范围 (如 3 或 0-3)，整段匹配，格式不正确的部分被忽略
+_RANGE_RE = re.compile(rb'\s*(\d+)(?:\s*-\s*(\d+))?\s*')
+
+# 扩展名到脚本类型的映射，未列出的扩展名需要根据shebang判断
+_EXT_MAP = MappingProxyType({
+    '.py': 'python',
+    '.python': 'python',
+    '.sh': 'shell',
+    '.bash': 'shell',
+    '.zsh': 'shell',
+    '': 'shell',
+})
+
+# 首行为python解释器的shebang，只在首行内匹配
+_SHEBANG_RE = re.compile(rb'[^\S\n]*#![^\n]*python')
+
+# 读取脚本文件的缓冲区大小
+_READ_BUFFER_SIZE = 128 * 1024
+
+# 设置CUDA_VISIBLE_DEVICES的格式，多种格式同时出现时按此顺序取最后一个格式的最后一次设置
+_CUDA_VISIBLE_DEVICES_KINDS = ('env', 'os_env', 'setdefault')
+
+# 脚本解析结果缓存的最大条目数
+_PARSE_CACHE_SIZE = 512
+
+
+class _UncachedResult(Exception):
+    """携带不应进入缓存的解析结果"""
+
+    def __init__(self, result: Dict):
+        super().__init__(result.get('error'))
+        self.result = result
+
+
+@functools.lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _extract_script_info_cached(abspath: str, mtime_ns: int, size: int) -> Dict:
+    """按(路径, 修改时间, 大小)缓存脚本解析结果，文件改动后键变化自动失效
+
+    无效结果可能由权限等暂时性问题导致（chmod不改变修改时间和大小），以异常带出，lru_cache不缓存异常
+    """
+    result = ScriptParser().extract_script_info(abspath)
+    if not result['is_valid']:
+        raise _UncachedResult(result)
+    return result
+
+
 class ScriptParser:
     """脚本解析类，用于解析shell和python脚本中的GPU需求"""
     
-    def __init__(self):
-        # 支持多种GPU设置格式
-        self.cuda_patterns = [
-            # CUDA_VISIBLE_DEVICES=0,1,2
-            re.compile(r'CUDA_VISIBLE_DEVICES\s*=\s*([0-9,\-\s]+)', re.IGNORECASE),
-            # os.environ['CUDA_VISIBLE_DEVICES'] = '0,1,2'
-            re.compile(r"os\.environ\[['\"]CUDA_VISIBLE_DEVICES['\"]\]\s*=\s*['\"]([0-9,\-\s]+)['\"]", re.IGNORECASE),
-            # os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0,1,2')
-            re.compile(r"os\.environ\.setdefault\(['\"]CUDA_VISIBLE_DEVICES['\"],\s*['\"]([0-9,\-\s]+)['\"]\)", re.IGNORECASE),
-            # torch.cuda.set_device(0)
-            re.compile(r'torch\.cuda\.set_device\((\d+)\)', re.IGNORECASE),
-            # device = torch.device('cuda:0')
-            re.compile(r"torch\.device\(['\"]cuda:(\d+)['\"]\)", re.IGNORECASE),
-        ]
-    
     def parse_script(self, script_path: str) -> Dict:
         """解析脚本文件，提取GPU需求信息"""
         try:
-            if not os.path.exists(script_path):
-                raise FileNotFoundError(f"脚本文件不存在: {script_path}")
+            raw, error = self._read_script(script_path)
+            if raw is None:
+                raise OSError(error)
             
-            with open(script_path, 'r', encoding='utf-8') as f:
-                script_content = f.read()
-            
-            return self.parse_script_content(script_content, script_path)
+            return self.parse_script_content_bytes(raw, script_path)
             
         except Exception as e:
             logging.error(f"解析脚本失败: {e}")
@@ -44,26 +91,39 @@ class ScriptParser:
     
     def parse_script_content(self, script_content: str, script_path: str = "") -> Dict:
         """解析脚本内容，提取GPU需求信息"""
+        return self.parse_script_content_bytes(script_content.encode('utf-8', errors='surrogateescape'), script_path)
+    
+    def parse_script_content_bytes(self, raw: bytes, script_path: str = "") -> Dict:
+        """解析脚本原始字节内容，提取GPU需求信息，只解码匹配到的片段"""
         try:
             # 判断脚本类型
-            script_type = self._get_script_type(script_path)
+            script_type = self._get_script_type(script_path, raw)
             logging.info(f"解析{script_type}脚本: {script_path}")
             
             # 查找GPU设置
-            gpu_indices = []
-            cuda_visible_devices = None
+            indices = set()
+            visible_devices = {}
             
-            for pattern in self.cuda_patterns:
-                matches = pattern.findall(script_content)
-                for match in matches:
-                    if match:
-                        indices = self._parse_gpu_indices(match)
-                        gpu_indices.extend(indices)
-                        if 'CUDA_VISIBLE_DEVICES' in str(pattern):
-                            cuda_visible_devices = match.strip()
+            # 所有格式都包含CUDA字样，先用字面量查找快速排除无关脚本，再运行正则；
+            # 正则不区分大小写，常见写法未命中时再按小写内容查找
+            has_cuda = b'CUDA' in raw or b'cuda' in raw or b'cuda' in raw.lower()
+            matches = _CUDA_RE.finditer(raw) if has_cuda else ()
             
-            # 去重并排序
-            gpu_indices = sorted(list(set(gpu_indices)))
+            # 单次扫描脚本内容，按匹配到的格式分派
+            for match in matches:
+                kind = match.lastgroup
+                value = match.group(kind)
+                if value:
+                    indices.update(self._parse_gpu_indices(value))
+                    if kind in _CUDA_VISIBLE_DEVICES_KINDS:
+                        visible_devices[kind] = value
+            
+            # 所有匹配累积在同一个集合中，最后只排序一次
+            gpu_indices = sorted(indices)
+            cuda_visible_devices = None
+            for kind in _CUDA_VISIBLE_DEVICES_KINDS:
+                if kind in visible_devices:
+                    cuda_visible_devices = visible_devices[kind].strip().decode('ascii')
             
             if not gpu_indices:
                 return {
@@ -95,72 +155,60 @@ class ScriptParser:
                 'error': str(e)
             }
     
-    def _get_script_type(self, script_path: str) -> str:
-        """判断脚本类型"""
+    def _get_script_type(self, script_path: str, head: bytes = b'') -> str:
+        """判断脚本类型，扩展名无法判断时根据脚本开头的shebang判断"""
         _, ext = os.path.splitext(script_path)
-        if ext.lower() in ['.py', '.python']:
-            return 'python'
-        elif ext.lower() in ['.sh', '.bash', '.zsh', '']:
-            return 'shell'
-        else:
-            # 检查文件头部来判断类型
-            try:
-                with open(script_path, 'r', encoding='utf-8') as f:
-                    first_line = f.readline().strip()
-                    if first_line.startswith('#!'):
-                        if 'python' in first_line:
-                            return 'python'
-                        elif any(shell in first_line for shell in ['bash', 'sh', 'zsh']):
-                            return 'shell'
-            except:
-                pass
-            return 'shell'  # 默认为shell
+        script_type = _EXT_MAP.get(ext.lower())
+        if script_type is not None:
+            return script_type
+        # 检查文件头部来判断类型
+        return 'python' if _SHEBANG_RE.match(head) else 'shell'  # 默认为shell
     
-    def _parse_gpu_indices(self, gpu_indices_str: str) -> List[int]:
-        """解析GPU索引字符串"""
-        indices = []
-        
-        # 处理逗号分隔的GPU索引
-        for part in gpu_indices_str.split(','):
-            part = part.strip()
-            if not part:
+    def _parse_gpu_indices(self, gpu_indices_str: bytes) -> Iterator[int]:
+        """解析GPU索引字符串，支持逗号分隔和范围表示法 (如 0,1,3-5)，逐个产出索引，不去重不排序"""
+        for part in gpu_indices_str.split(b','):
+            if not part.strip():
                 continue
-            
-            # 处理范围表示法 (如 0-3)
-            if '-' in part:
-                try:
-                    start, end = map(int, part.split('-'))
-                    indices.extend(range(start, end + 1))
-                except ValueError:
-                    logging.warning(f"无效的GPU范围: {part}")
+            match = _RANGE_RE.fullmatch(part)
+            if match is None:
+                logging.warning(f"无效的GPU索引: {part.strip().decode('ascii')}")
+                continue
+            start, end = match.groups()
+            start = int(start)
+            if end:
+                yield from range(start, int(end) + 1)
             else:
-                try:
-                    indices.append(int(part))
-                except ValueError:
-                    logging.warning(f"无效的GPU索引: {part}")
-        
-        # 去重并排序
-        return sorted(list(set(indices)))
+                yield start
+    
+    def _read_script(self, script_path: str) -> Tuple[Optional[bytes], str]:
+        """一次性读取脚本文件内容，返回(内容, 错误信息)，读取失败时内容为None"""
+        try:
+            with open(script_path, 'rb', buffering=_READ_BUFFER_SIZE) as f:
+                return f.read(), ""
+        except FileNotFoundError:
+            return None, f"脚本文件不存在: {script_path}"
+        except PermissionError:
+            return None, f"无法读取脚本文件: {script_path}"
+        except OSError as e:
+            return None, f"脚本验证失败: {e}"
     
     def validate_script(self, script_path: str) -> Tuple[bool, str]:
         """验证脚本是否有效"""
+        raw, error = self._read_script(script_path)
+        if raw is None:
+            return False, error
+        return self._validate_content(raw, script_path)
+    
+    def _validate_content(self, raw: bytes, script_path: str) -> Tuple[bool, str]:
+        """根据已读取的脚本内容验证脚本"""
         try:
-            if not os.path.exists(script_path):
-                return False, f"脚本文件不存在: {script_path}"
-            
-            if not os.access(script_path, os.R_OK):
-                return False, f"无法读取脚本文件: {script_path}"
-            
             # 检查文件扩展名
-            script_type = self._get_script_type(script_path)
+            script_type = self._get_script_type(script_path, raw)
             _, ext = os.path.splitext(script_path)
             
-            if script_type == 'python':
-                if ext.lower() not in ['.py', '.python', '']:
-                    logging.warning(f"Python脚本文件扩展名可能不正确: {script_path}")
-            else:
-                if ext.lower() not in ['.sh', '.bash', '.zsh', '']:
-                    logging.warning(f"Shell脚本文件扩展名可能不正确: {script_path}")
+            if ext.lower() not in _EXT_MAP:
+                label = 'Python' if script_type == 'python' else 'Shell'
+                logging.warning(f"{label}脚本文件扩展名可能不正确: {script_path}")
             
             return True, f"{script_type}脚本验证通过"
             
@@ -168,9 +216,13 @@ class ScriptParser:
             return False, f"脚本验证失败: {e}"
     
     def extract_script_info(self, script_path: str) -> Dict:
-        """提取脚本的完整信息"""
+        """提取脚本的完整信息，脚本文件只读取一次"""
         # 验证脚本
-        is_valid, message = self.validate_script(script_path)
+        raw, message = self._read_script(script_path)
+        if raw is not None:
+            is_valid, message = self._validate_content(raw, script_path)
+        else:
+            is_valid = False
         
         if not is_valid:
             return {
@@ -181,7 +233,26 @@ class ScriptParser:
             }
         
         # 解析脚本
-        parse_result = self.parse_script(script_path)
+        parse_result = self.parse_script_content_bytes(raw, script_path)
         parse_result['validation_message'] = message
         
-        return parse_result 
\ No newline at end of file
+        return parse_result
+    
+    def extract_script_info_cached(self, script_path: str) -> Dict:
+        """提取脚本的完整信息，同一脚本未修改时直接复用上次的解析结果"""
+        try:
+            st = os.stat(script_path)
+        except OSError:
+            return self.extract_script_info(script_path)
+        
+        try:
+            cached = _extract_script_info_cached(os.path.abspath(script_path), st.st_mtime_ns, st.st_size)
+        except _UncachedResult as e:
+            cached = e.result
+        
+        # 返回副本，避免调用方修改缓存中的结果
+        result = dict(cached)
+        result['script_path'] = script_path
+        if 'gpu_indices' in result:
+            result['gpu_indices'] = list(result['gpu_indices'])
+        return result
\ No newline at end of file
@@ -1,10 +1,14 @@
 import time
 import threading
-import queue
+import heapq
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set
+from collections import OrderedDict
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 from enum import Enum
 
 from gpu_monitor import GPUMonitor
@@ -21,6 +25,11 @@ class TaskStatus(Enum):
     CANCELLED = "cancelled"
 
 
+def _format_ns(timestamp_ns: int) -> str:
+    """将纳秒时间戳格式化为本地时间的ISO字符串"""
+    return datetime.fromtimestamp(timestamp_ns / 1e9).isoformat()
+
+
 @dataclass
 class Task:
     """任务数据类"""
@@ -30,23 +39,53 @@ class Task:
     gpu_indices: List[int]
     priority: int = 0
     status: TaskStatus = TaskStatus.PENDING
-    created_at: datetime = None
-    started_at: datetime = None
-    completed_at: datetime = None
+    # 时间戳为time.time_ns()纳秒整数，序列化时才格式化为ISO字符串
+    created_at: Optional[int] = None
+    started_at: Optional[int] = None
+    completed_at: Optional[int] = None
     error_message: str = ""
     output: str = ""
+    # to_dict()结果缓存，任何字段被修改时自动失效
+    _dict_cache: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
+    # 字段修改计数，用于判断构造字典期间任务是否被其他线程修改
+    _writes: int = field(default=0, init=False, repr=False, compare=False)
+    # 创建时间的ISO字符串，创建后不再变化，只格式化一次
+    _created_iso: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.created_at is None:
-            self.created_at = datetime.now()
+            self.created_at = time.time_ns()
+        self._created_iso = _format_ns(self.created_at)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != '_dict_cache' and name != '_writes':
+            object.__setattr__(self, '_writes', self._writes + 1)
+            object.__setattr__(self, '_dict_cache', None)
 
     def to_dict(self):
-        """转换为字典"""
-        result = asdict(self)
-        result['status'] = self.status.value
-        result['created_at'] = self.created_at.isoformat() if self.created_at else None
-        result['started_at'] = self.started_at.isoformat() if self.started_at else None
-        result['completed_at'] = self.completed_at.isoformat() if self.completed_at else None
+        """转换为字典，结果会被缓存直到任务被修改，调用方不应修改返回值"""
+        if self._dict_cache is not None:
+            return self._dict_cache
+        writes = self._writes
+        # 直接构造字典，避免asdict逐字段深拷贝；gpu_indices在任务内不会被修改，直接引用
+        result = {
+            'id': self.id,
+            'script_path': self.script_path,
+            'required_gpus': self.required_gpus,
+            'gpu_indices': self.gpu_indices,
+            'priority': self.priority,
+            'status': self.status.value,
+            'created_at': self._created_iso,
+            'started_at': _format_ns(self.started_at) if self.started_at else None,
+            'completed_at': _format_ns(self.completed_at) if self.completed_at else None,
+            'error_message': self.error_message,
+            'output': self.output
+        }
+        # 先写入缓存再检查修改计数：构造期间任务被修改过则撤销缓存，避免旧状态被永久缓存
+        self._dict_cache = result
+        if self._writes != writes:
+            self._dict_cache = None
         return result
 
 
@@ -56,7 +95,8 @@ class TaskScheduler:
     def __init__(self,
                  retry_interval: int = 5,      # 重试间隔（秒）
                  idle_interval: int = 1,       # 空闲间隔（秒）
-                 error_interval: int = 5):     # 错误间隔（秒）
+                 error_interval: int = 5,      # 错误间隔（秒）
+                 max_completed: int = 1000):   # 保留的已完成任务数量上限
         self.gpu_monitor = GPUMonitor()
         self.script_parser = ScriptParser()
         self.script_executor = ScriptExecutor()
@@ -66,14 +106,32 @@ class TaskScheduler:
         self.idle_interval = idle_interval
         self.error_interval = error_interval
 
-        self.task_queue = queue.PriorityQueue()
+        # 待执行任务堆，元素为(-优先级, 提交序号, 任务)；堆、运行中和已完成任务表的修改都由self.lock保护
+        self._heap = []
         self.running_tasks = {}
-        self.completed_tasks = {}
+        # 已完成任务按完成顺序保存，超过上限时丢弃最早的记录
+        self.completed_tasks = OrderedDict()
+        self.max_completed = max_completed
         self.task_counter = 0
 
         self.scheduler_thread = None
         self.is_running = False
         self.lock = threading.Lock()
+        # 有新任务提交、任务结束、GPU快照刷新或调度器停止时唤醒调度循环
+        self._cv = threading.Condition(self.lock)
+        self.gpu_monitor.add_refresh_listener(self._on_gpu_refresh)
+
+        # 任务执行线程池，按GPU数量确定并发上限，使多个任务可同时在不同GPU上运行
+        self.max_workers = self.gpu_monitor.device_count or 4
+        self._pool = None
+        self._active_tasks = 0
+        # 已分派任务指定的GPU，任务结束前不再分派使用这些GPU的任务；GPU快照定期刷新，不能单独作为分派依据
+        self._reserved_gpus: Set[int] = set()
+
+        # 状态变化监听器，状态每次变化时版本号递增并以新版本号回调
+        self._listeners: List[Callable[[int], None]] = []
+        self._version_counter = itertools.count(1)
+        self.state_version = 0
 
         logging.info(f"任务调度器初始化完成 - 重试间隔: {retry_interval}s, 空闲间隔: {idle_interval}s")
 
@@ -84,22 +142,30 @@ class TaskScheduler:
             return
 
         self.is_running = True
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='task')
         self.scheduler_thread = threading.Thread(target=self._scheduler_loop, daemon=True)
         self.scheduler_thread.start()
         logging.info("调度器已启动")
+        self.notify_listeners()
 
     def stop(self):
         """停止调度器"""
-        self.is_running = False
+        with self._cv:
+            self.is_running = False
+            self._cv.notify_all()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
+        if self._pool:
+            # 不再接受新任务，已在运行的任务继续执行完毕
+            self._pool.shutdown(wait=False)
         logging.info("调度器已停止")
+        self.notify_listeners()
 
     def submit_task(self, script_path: str, priority: int = 0) -> str:
         """提交任务到队列"""
         try:
-            # 解析脚本
-            script_info = self.script_parser.extract_script_info(script_path)
+            # 解析脚本，重复提交未修改的脚本时复用解析结果
+            script_info = self.script_parser.extract_script_info_cached(script_path)
 
             if not script_info['is_valid']:
                 raise ValueError(f"脚本无效: {script_info.get('error', '未知错误')}")
@@ -107,7 +173,8 @@ class TaskScheduler:
             # 创建任务
             with self.lock:
                 self.task_counter += 1
-                task_id = f"task_{self.task_counter}"
+                seq = self.task_counter
+                task_id = f"task_{seq}"
 
             task = Task(
                 id=task_id,
@@ -117,10 +184,13 @@ class TaskScheduler:
                 priority=priority
             )
 
-            # 添加到队列 (优先级越高，数字越小)
-            self.task_queue.put((-priority, task))
+            # 添加到队列 (优先级越高，数字越小；序号保证同优先级先进先出)
+            with self._cv:
+                heapq.heappush(self._heap, (-priority, seq, task))
+                self._cv.notify()
 
             logging.info(f"任务已提交: {task_id}, 需要GPU: {script_info['required_gpus']}")
+            self.notify_listeners()
             return task_id
 
         except Exception as e:
@@ -129,112 +199,121 @@ class TaskScheduler:
 
     def get_task_status(self, task_id: str) -> Optional[Dict]:
         """获取任务状态"""
-        # 检查运行中的任务
-        if task_id in self.running_tasks:
-            task = self.running_tasks[task_id]
-            return task.to_dict()
-
-        # 检查已完成的任务
-        if task_id in self.completed_tasks:
-            task = self.completed_tasks[task_id]
+        # 检查运行中和已完成的任务
+        task = self.running_tasks.get(task_id) or self.completed_tasks.get(task_id)
+        if task is not None:
             return task.to_dict()
 
         # 检查队列中的任务
         with self.lock:
-            temp_queue = queue.PriorityQueue()
-            found_task = None
-
-            while not self.task_queue.empty():
-                priority, task = self.task_queue.get()
+            for _, _, task in self._heap:
                 if task.id == task_id:
-                    found_task = task
-                temp_queue.put((priority, task))
+                    return task.to_dict()
 
-            # 恢复队列
-            self.task_queue = temp_queue
+        return None
 
-            if found_task:
-                return found_task.to_dict()
+    def get_tasks_status(self, task_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        """批量获取任务状态，等待队列只加锁扫描一次；不存在的任务对应None"""
+        found = {}
+        for task_id in task_ids:
+            task = self.running_tasks.get(task_id) or self.completed_tasks.get(task_id)
+            if task is not None:
+                found[task_id] = task.to_dict()
 
-        return None
+        missing = set(task_ids).difference(found)
+        if missing:
+            with self.lock:
+                for _, _, task in self._heap:
+                    if task.id in missing:
+                        found[task.id] = task.to_dict()
+
+        return {task_id: found.get(task_id) for task_id in task_ids}
 
     def get_all_tasks(self) -> Dict:
         """获取所有任务信息"""
         with self.lock:
-            # 获取队列中的任务
-            pending_tasks = []
-            temp_queue = queue.PriorityQueue()
-
-            while not self.task_queue.empty():
-                priority, task = self.task_queue.get()
-                pending_tasks.append(task.to_dict())
-                temp_queue.put((priority, task))
-
-            # 恢复队列
-            self.task_queue = temp_queue
+            # 获取队列中的任务，按调度顺序排列
+            pending_tasks = [task.to_dict() for _, _, task in sorted(self._heap)]
+            # 执行线程会并发增删任务表，持锁复制后在锁外转换
+            running = list(self.running_tasks.values())
+            completed = list(self.completed_tasks.values())
 
         return {
             'pending': pending_tasks,
-            'running': [task.to_dict() for task in self.running_tasks.values()],
-            'completed': [task.to_dict() for task in self.completed_tasks.values()]
+            'running': [task.to_dict() for task in running],
+            'completed': [task.to_dict() for task in completed]
         }
 
     def cancel_task(self, task_id: str) -> bool:
         """取消任务"""
         # 检查运行中的任务
-        if task_id in self.running_tasks:
-            task = self.running_tasks[task_id]
-            task.status = TaskStatus.CANCELLED
-            task.completed_at = datetime.now()
-            self.completed_tasks[task_id] = task
-            del self.running_tasks[task_id]
+        with self.lock:
+            task = self.running_tasks.pop(task_id, None)
+            if task is not None:
+                task.status = TaskStatus.CANCELLED
+                task.completed_at = time.time_ns()
+                self._add_completed(task)
+        if task is not None:
             logging.info(f"任务已取消: {task_id}")
+            self.notify_listeners()
             return True
 
         # 检查队列中的任务
+        cancelled = False
         with self.lock:
-            temp_queue = queue.PriorityQueue()
-            cancelled = False
-
-            while not self.task_queue.empty():
-                priority, task = self.task_queue.get()
+            for i, (_, _, task) in enumerate(self._heap):
                 if task.id == task_id:
                     task.status = TaskStatus.CANCELLED
-                    task.completed_at = datetime.now()
-                    self.completed_tasks[task_id] = task
+                    task.completed_at = time.time_ns()
+                    self._add_completed(task)
+                    # 用末尾元素填补空位后重新堆化
+                    last = self._heap.pop()
+                    if i < len(self._heap):
+                        self._heap[i] = last
+                        heapq.heapify(self._heap)
+                    logging.info(f"任务已取消: {task_id}")
                     cancelled = True
-                else:
-                    temp_queue.put((priority, task))
+                    break
 
-            # 恢复队列
-            self.task_queue = temp_queue
+        if cancelled:
+            self.notify_listeners()
+        return cancelled
 
-            if cancelled:
-                logging.info(f"任务已取消: {task_id}")
-                return True
-
-        return False
+    def _add_completed(self, task: Task):
+        """记录已结束的任务，超过保留上限时丢弃最早的记录；调用方需持有self.lock"""
+        self.completed_tasks[task.id] = task
+        while len(self.completed_tasks) > self.max_completed:
+            self.completed_tasks.popitem(last=False)
 
     def _scheduler_loop(self):
         """调度器主循环"""
         while self.is_running:
             try:
-                # 检查是否有可执行的任务
-                if not self.task_queue.empty():
+                # 队列为空或执行线程已满时等待，不再轮询
+                with self._cv:
+                    while self.is_running and (not self._heap or self._active_tasks >= self.max_workers):
+                        self._cv.wait(self.idle_interval)
+                    if not self.is_running:
+                        break
                     # 获取最高优先级的任务
-                    priority, task = self.task_queue.get()
-
-                    # 检查GPU可用性
-                    if self.gpu_monitor.check_gpu_availability(task.required_gpus):
-                        # 执行任务
-                        self._execute_task(task)
-                    else:
-                        # 放回队列
-                        self.task_queue.put((priority, task))
-                        logging.debug(f"任务 {task.id} 等待GPU可用，{self.retry_interval}秒后重试")
-                        time.sleep(self.retry_interval)  # 等待配置的重试间隔后重试
+                    item = heapq.heappop(self._heap)
+
+                task = item[2]
+
+                # 检查GPU可用性
+                if self._gpus_free(task):
+                    # 在线程池中执行任务，调度循环继续分派后续任务
+                    with self._cv:
+                        self._active_tasks += 1
+                        self._reserved_gpus.update(task.gpu_indices)
+                    self._pool.submit(self._execute_task, task).add_done_callback(
+                        functools.partial(self._on_task_done, task))
                 else:
-                    time.sleep(self.idle_interval)  # 队列为空时等待配置的空闲间隔
+                    # 放回队列，等待重试间隔；有新任务提交、任务结束或GPU快照刷新时提前重试
+                    with self._cv:
+                        heapq.heappush(self._heap, item)
+                        logging.debug(f"任务 {task.id} 等待GPU可用，{self.retry_interval}秒后重试")
+                        self._cv.wait(self.retry_interval)
 
             except Exception as e:
                 logging.error(f"调度器循环错误: {e}")
@@ -245,10 +324,12 @@ class TaskScheduler:
         try:
             # 更新任务状态
             task.status = TaskStatus.RUNNING
-            task.started_at = datetime.now()
-            self.running_tasks[task.id] = task
+            task.started_at = time.time_ns()
+            with self.lock:
+                self.running_tasks[task.id] = task
 
             logging.info(f"开始执行任务: {task.id}")
+            self.notify_listeners()
 
             # 执行脚本
             result = self.script_executor.execute_script(
@@ -257,7 +338,7 @@ class TaskScheduler:
             )
 
             # 更新任务状态
-            task.completed_at = datetime.now()
+            task.completed_at = time.time_ns()
             task.output = result.get('output', '')
 
             if result['success']:
@@ -269,17 +350,63 @@ class TaskScheduler:
                 logging.error(f"任务执行失败: {task.id}, 错误: {task.error_message}")
 
             # 移动到已完成任务列表
-            self.completed_tasks[task.id] = task
-            del self.running_tasks[task.id]
+            with self.lock:
+                self._add_completed(task)
+                self.running_tasks.pop(task.id, None)
+
+            # 任务结束后GPU状态已变化，通知监控立即刷新
+            self.gpu_monitor.invalidate()
 
         except Exception as e:
             logging.error(f"执行任务时发生错误: {task.id}, {e}")
             task.status = TaskStatus.FAILED
             task.error_message = str(e)
-            task.completed_at = datetime.now()
-            self.completed_tasks[task.id] = task
-            if task.id in self.running_tasks:
-                del self.running_tasks[task.id]
+            task.completed_at = time.time_ns()
+            with self.lock:
+                self._add_completed(task)
+                self.running_tasks.pop(task.id, None)
+
+    def _gpus_free(self, task: Task) -> bool:
+        """任务指定的GPU未被已分派任务占用，且除已分派任务占用的GPU外可用GPU数量足够"""
+        with self._cv:
+            reserved = set(self._reserved_gpus)
+        if reserved.intersection(task.gpu_indices):
+            return False
+        available = [index for index in self.gpu_monitor.get_available_gpus() if index not in reserved]
+        return len(available) >= task.required_gpus
+
+    def _on_task_done(self, task: Task, future):
+        """任务执行结束回调，释放执行名额和GPU并唤醒调度循环重新检查等待GPU的任务"""
+        with self._cv:
+            self._active_tasks -= 1
+            self._reserved_gpus.difference_update(task.gpu_indices)
+            self._cv.notify()
+        self.notify_listeners()
+
+    def _on_gpu_refresh(self):
+        """GPU快照刷新回调，唤醒等待GPU的调度循环按新快照重新检查"""
+        with self._cv:
+            self._cv.notify()
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """注册状态变化监听器，回调在调度器线程中执行，应尽快返回"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[int], None]):
+        """移除状态变化监听器"""
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    def notify_listeners(self):
+        """递增状态版本号并通知所有监听器"""
+        self.state_version = version = next(self._version_counter)
+        for callback in list(self._listeners):
+            try:
+                callback(version)
+            except Exception as e:
+                logging.error(f"状态监听器回调失败: {e}")
 
     def get_system_status(self) -> Dict:
         """获取系统状态"""
@@ -287,7 +414,7 @@ class TaskScheduler:
 
         return {
             'gpu_status': gpu_status,
-            'queue_size': self.task_queue.qsize(),
+            'queue_size': len(self._heap),
             'running_tasks': len(self.running_tasks),
             'completed_tasks': len(self.completed_tasks),
             'scheduler_running': self.is_running,
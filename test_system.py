@@ -81,6 +81,49 @@ def test_script_parser():
         print(f"脚本解析测试失败: {e}")
         return False
 
+def test_gpu_index_parsing():
+    """测试GPU索引解析，期望结果与逐个正则、逐段int()解析的原实现一致"""
+    print("\n测试GPU索引解析...")
+    try:
+        from script_parser import ScriptParser
+        
+        parser = ScriptParser()
+        
+        # (脚本内容, 期望的GPU索引, 期望的CUDA_VISIBLE_DEVICES)
+        test_cases = [
+            ("CUDA_VISIBLE_DEVICES=0,1,3-5\n", [0, 1, 3, 4, 5], "0,1,3-5"),
+            ("CUDA_VISIBLE_DEVICES=0 - 2 python train.py\n", [0, 1, 2], "0 - 2"),
+            ("Cuda_Visible_Devices=2\n", [2], "2"),
+            ("CUDA_VISIBLE_DEVICES=1-2-3,4\n", [4], "1-2-3,4"),
+            ("CUDA_VISIBLE_DEVICES=,2,\n", [2], ",2,"),
+            # 格式不正确的取值整体被忽略
+            ("CUDA_VISIBLE_DEVICES=0 1\n", [], None),
+            ("CUDA_VISIBLE_DEVICES=3-\n", [], None),
+            # 取值截止到行尾，后续行中的数字不是GPU索引
+            ("CUDA_VISIBLE_DEVICES=1\n\n5 epochs\n", [1], "1"),
+            ("os.environ['CUDA_VISIBLE_DEVICES'] = '0, 2'\n", [0, 2], "0, 2"),
+            ("torch.cuda.set_device(3)\n", [3], None),
+            ("device = torch.device('cuda:1')\n", [1], None),
+            # 多种格式同时出现时，CUDA_VISIBLE_DEVICES取最后一种格式的设置
+            ("os.environ.setdefault('CUDA_VISIBLE_DEVICES', '4')\nCUDA_VISIBLE_DEVICES=9\n", [4, 9], "4"),
+            ("print('hello')\n", [], None),
+        ]
+        
+        passed = True
+        for content, expected_indices, expected_devices in test_cases:
+            result = parser.parse_script_content(content, "test.sh")
+            ok = (result['gpu_indices'] == expected_indices and
+                  result.get('cuda_visible_devices') == expected_devices)
+            print(f"  {content.strip()!r}: {result['gpu_indices']} {'✅' if ok else '❌'}")
+            if not ok:
+                print(f"    期望: {expected_indices}, {expected_devices!r}, 实际: {result.get('cuda_visible_devices')!r}")
+                passed = False
+        
+        return passed
+    except Exception as e:
+        print(f"GPU索引解析测试失败: {e}")
+        return False
+
 def test_task_scheduler():
     """测试任务调度模块"""
     print("\n测试任务调度模块...")
@@ -189,6 +232,383 @@ def test_script_type_detection():
         print(f"脚本类型检测测试失败: {e}")
         return False
 
+def _report_checks(checks):
+    """逐项打印检查结果，全部通过时返回True"""
+    passed = True
+    for name, ok in checks:
+        print(f"  {name}: {'✅' if ok else '❌'}")
+        passed = passed and ok
+    return passed
+
+def test_json_body_validation():
+    """测试不合法的JSON请求体返回400（不启动调度器）"""
+    print("\n测试JSON请求体校验...")
+    try:
+        import asyncio
+        from web_app import app
+        
+        async def run():
+            client = app.test_client()
+            checks = []
+            for url in ('/api/submit', '/api/config', '/api/tasks/status'):
+                response = await client.post(url, data=b'{bad', headers={'Content-Type': 'application/json'})
+                checks.append((f"{url} 请求体不是合法JSON时返回400", response.status_code == 400))
+            return checks
+        
+        return _report_checks(asyncio.run(run()))
+    except Exception as e:
+        print(f"JSON请求体校验测试失败: {e}")
+        return False
+
+def test_response_caching():
+    """测试任务列表的ETag、304和gzip压缩（不启动调度器）"""
+    print("\n测试响应缓存与压缩...")
+    try:
+        import asyncio
+        import gzip
+        from web_app import app
+        
+        python_script_path = "example_python_script.py"
+        
+        async def run():
+            client = app.test_client()
+            checks = []
+            
+            # 提交足够多的任务，使任务列表超过gzip压缩阈值
+            for _ in range(10):
+                await client.post('/api/submit', json={'script_path': python_script_path})
+            
+            # ETag与304
+            response = await client.get('/api/tasks')
+            body = await response.get_data()
+            etag = response.headers.get('ETag')
+            checks.append(("GET /api/tasks 返回ETag", response.status_code == 200 and bool(etag)))
+            response = await client.get('/api/tasks', headers={'If-None-Match': etag})
+            checks.append(("If-None-Match命中时返回304", response.status_code == 304))
+            
+            # gzip压缩，压缩后的响应使用不同的ETag
+            response = await client.get('/api/tasks', headers={'Accept-Encoding': 'gzip'})
+            gz_etag = response.headers.get('ETag')
+            checks.append(("Accept-Encoding: gzip时压缩响应",
+                           response.headers.get('Content-Encoding') == 'gzip' and
+                           gzip.decompress(await response.get_data()) == body))
+            checks.append(("gzip响应的ETag与未压缩响应不同", bool(gz_etag) and gz_etag != etag))
+            response = await client.get('/api/tasks', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gz_etag})
+            checks.append(("gzip响应的If-None-Match命中时返回304", response.status_code == 304))
+            return checks
+        
+        return _report_checks(asyncio.run(run()))
+    except Exception as e:
+        print(f"响应缓存与压缩测试失败: {e}")
+        return False
+
+def test_batch_task_status():
+    """测试批量查询任务状态接口（不启动调度器）"""
+    print("\n测试批量查询任务状态...")
+    try:
+        import asyncio
+        from web_app import app
+        
+        python_script_path = "example_python_script.py"
+        
+        async def run():
+            client = app.test_client()
+            checks = []
+            response = await client.post('/api/submit', json={'script_path': python_script_path})
+            task_id = (await response.get_json())['task_id']
+            
+            response = await client.post('/api/tasks/status', json={'ids': [task_id, 'task_missing']})
+            statuses = await response.get_json()
+            checks.append(("批量查询任务状态",
+                           response.status_code == 200 and
+                           statuses[task_id]['status'] == 'pending' and
+                           statuses['task_missing'] is None))
+            response = await client.post('/api/tasks/status', json={'ids': 'task_1'})
+            checks.append(("ids不是列表时返回400", response.status_code == 400))
+            return checks
+        
+        return _report_checks(asyncio.run(run()))
+    except Exception as e:
+        print(f"批量查询任务状态测试失败: {e}")
+        return False
+
+class _StubGPUMonitor:
+    """替代GPUMonitor的测试桩，不访问NVML也不启动轮询线程，可用GPU由测试直接设置"""
+    
+    def __init__(self, device_count=2):
+        self.device_count = device_count
+        self.available = list(range(device_count))
+        self._refresh_listeners = []
+    
+    def add_refresh_listener(self, callback):
+        self._refresh_listeners.append(callback)
+    
+    def refresh(self):
+        """模拟一次GPU快照刷新"""
+        for callback in list(self._refresh_listeners):
+            callback()
+    
+    def get_available_gpus(self):
+        return list(self.available)
+    
+    def check_gpu_availability(self, required_count):
+        return len(self.available) >= required_count
+    
+    def invalidate(self):
+        pass
+    
+    def get_gpu_status_summary(self):
+        return {'total_gpus': self.device_count, 'available_gpus': len(self.available), 'gpu_details': []}
+
+def _make_scheduler(**kwargs):
+    """创建使用GPU监控桩的调度器"""
+    import task_scheduler
+    
+    original = task_scheduler.GPUMonitor
+    task_scheduler.GPUMonitor = _StubGPUMonitor
+    try:
+        return task_scheduler.TaskScheduler(**kwargs)
+    finally:
+        task_scheduler.GPUMonitor = original
+
+def _write_temp_script(content):
+    """写入临时Python脚本并返回路径，调用方负责删除"""
+    import tempfile
+    
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as f:
+        f.write(content)
+    return f.name
+
+def _heap_order(scheduler):
+    """按出队顺序返回待执行任务ID"""
+    import heapq
+    
+    heap = list(scheduler._heap)
+    return [heapq.heappop(heap)[2].id for _ in range(len(heap))]
+
+def test_task_queue_order():
+    """测试同优先级任务先进先出，以及从堆中间取消任务"""
+    print("\n测试任务队列顺序...")
+    script_path = _write_temp_script('print("ok")\n')
+    try:
+        from task_scheduler import TaskStatus
+        
+        scheduler = _make_scheduler()
+        checks = []
+        
+        ids = [scheduler.submit_task(script_path, priority=p) for p in (0, 5, 1, 5, 1)]
+        order = _heap_order(scheduler)
+        checks.append(("高优先级先出队，同优先级按提交顺序",
+                       order == [ids[1], ids[3], ids[2], ids[4], ids[0]]))
+        
+        # 取消既不在堆顶也不在末尾的任务
+        middle_id = scheduler._heap[1][2].id
+        checks.append(("取消队列中的任务", scheduler.cancel_task(middle_id)))
+        checks.append(("取消后其余任务顺序不变",
+                       _heap_order(scheduler) == [i for i in order if i != middle_id]))
+        checks.append(("被取消的任务进入已完成列表",
+                       scheduler.completed_tasks[middle_id].status == TaskStatus.CANCELLED))
+        checks.append(("重复取消返回False", not scheduler.cancel_task(middle_id)))
+        
+        return _report_checks(checks)
+    except Exception as e:
+        print(f"任务队列顺序测试失败: {e}")
+        return False
+    finally:
+        os.unlink(script_path)
+
+def test_completed_tasks_limit():
+    """测试已完成任务数量上限和to_dict缓存失效"""
+    print("\n测试已完成任务上限...")
+    script_path = _write_temp_script('print("ok")\n')
+    try:
+        from task_scheduler import Task, TaskStatus
+        
+        scheduler = _make_scheduler(max_completed=3)
+        checks = []
+        
+        ids = [scheduler.submit_task(script_path) for _ in range(5)]
+        for task_id in ids:
+            scheduler.cancel_task(task_id)
+        checks.append(("只保留最近的max_completed个任务", list(scheduler.completed_tasks) == ids[-3:]))
+        checks.append(("被丢弃的任务查询不到", scheduler.get_task_status(ids[0]) is None))
+        
+        task = Task(id="task_cache", script_path=script_path, required_gpus=0, gpu_indices=[])
+        first = task.to_dict()
+        checks.append(("未修改时to_dict返回缓存", task.to_dict() is first))
+        task.status = TaskStatus.RUNNING
+        second = task.to_dict()
+        checks.append(("修改字段后to_dict重新生成",
+                       second is not first and second['status'] == 'running' and first['status'] == 'pending'))
+        
+        return _report_checks(checks)
+    except Exception as e:
+        print(f"已完成任务上限测试失败: {e}")
+        return False
+    finally:
+        os.unlink(script_path)
+
+class _BlockingExecutor:
+    """替代ScriptExecutor的测试桩，任务阻塞到release被设置后才结束，并记录同时运行的任务"""
+    
+    def __init__(self):
+        import threading
+        
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = []
+        self.max_running = 0
+        self.overlaps = []
+    
+    def execute_script(self, script_path, gpu_indices):
+        with self.lock:
+            for other in self.running:
+                if set(other).intersection(gpu_indices):
+                    self.overlaps.append((other, gpu_indices))
+            self.running.append(gpu_indices)
+            self.max_running = max(self.max_running, len(self.running))
+        self.release.wait(10)
+        with self.lock:
+            self.running.remove(gpu_indices)
+        return {'success': True, 'output': ''}
+
+def _wait_for(predicate, timeout=2.0):
+    """轮询等待条件成立，超时返回False"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_dispatch_wakeup():
+    """测试任务结束和GPU快照刷新后立即重新分派，不等待空闲或重试间隔"""
+    print("\n测试任务分派唤醒...")
+    script_path = _write_temp_script('print("ok")\n')
+    gpu_script_path = _write_temp_script('import os\nos.environ["CUDA_VISIBLE_DEVICES"] = "0"\n')
+    scheduler = None
+    try:
+        scheduler = _make_scheduler(retry_interval=30, idle_interval=30)
+        scheduler.max_workers = 1
+        executor = _BlockingExecutor()
+        scheduler.script_executor = executor
+        checks = []
+        
+        def status(task_id):
+            return scheduler.get_task_status(task_id)['status']
+        
+        scheduler.start()
+        
+        # 执行名额已满时第二个任务等待，第一个任务结束后立即分派
+        first = scheduler.submit_task(script_path)
+        second = scheduler.submit_task(script_path)
+        checks.append(("第一个任务开始执行", _wait_for(lambda: status(first) == 'running')))
+        time.sleep(0.1)
+        checks.append(("执行名额已满时第二个任务等待", status(second) == 'pending'))
+        executor.release.set()
+        checks.append(("第一个任务结束后立即分派第二个任务", _wait_for(lambda: status(second) == 'completed')))
+        
+        # GPU不可用时任务等待，GPU快照刷新后立即重试
+        scheduler.gpu_monitor.available = []
+        gpu_task = scheduler.submit_task(gpu_script_path)
+        time.sleep(0.1)
+        checks.append(("GPU不可用时任务等待", status(gpu_task) == 'pending'))
+        scheduler.gpu_monitor.available = [0, 1]
+        scheduler.gpu_monitor.refresh()
+        checks.append(("GPU快照刷新后立即分派", _wait_for(lambda: status(gpu_task) == 'completed')))
+        
+        return _report_checks(checks)
+    except Exception as e:
+        print(f"任务分派唤醒测试失败: {e}")
+        return False
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        os.unlink(script_path)
+        os.unlink(gpu_script_path)
+
+def test_dispatch_limits():
+    """测试同时运行的任务数不超过执行线程数，且使用同一GPU的任务不会同时运行"""
+    print("\n测试任务分派限制...")
+    script_path = _write_temp_script('print("ok")\n')
+    gpu_script_path = _write_temp_script('import os\nos.environ["CUDA_VISIBLE_DEVICES"] = "0"\n')
+    scheduler = None
+    try:
+        scheduler = _make_scheduler(retry_interval=30, idle_interval=30)
+        scheduler.max_workers = 2
+        executor = _BlockingExecutor()
+        scheduler.script_executor = executor
+        checks = []
+        
+        scheduler.start()
+        
+        # 提交超过执行线程数的任务，最多max_workers个同时运行
+        ids = [scheduler.submit_task(script_path) for _ in range(4)]
+        checks.append(("执行线程满载", _wait_for(lambda: len(executor.running) == 2)))
+        time.sleep(0.1)
+        checks.append(("同时运行的任务数不超过max_workers",
+                       executor.max_running == 2 and scheduler._active_tasks == 2 and len(scheduler._heap) == 2))
+        executor.release.set()
+        checks.append(("所有任务执行完毕", _wait_for(
+            lambda: all(scheduler.get_task_status(i)['status'] == 'completed' for i in ids))))
+        
+        # 使用GPU 0的两个任务依次执行，GPU快照始终显示可用也不会同时分派
+        executor.release.clear()
+        executor.max_running = 0
+        gpu_ids = [scheduler.submit_task(gpu_script_path) for _ in range(2)]
+        checks.append(("第一个GPU任务开始执行", _wait_for(lambda: len(executor.running) == 1)))
+        scheduler.gpu_monitor.refresh()
+        time.sleep(0.1)
+        checks.append(("GPU已被预留时第二个任务等待",
+                       scheduler.get_task_status(gpu_ids[1])['status'] == 'pending' and
+                       scheduler._reserved_gpus == {0}))
+        executor.release.set()
+        checks.append(("GPU任务依次执行完毕", _wait_for(
+            lambda: all(scheduler.get_task_status(i)['status'] == 'completed' for i in gpu_ids))))
+        checks.append(("使用同一GPU的任务没有同时运行", not executor.overlaps and executor.max_running == 1))
+        checks.append(("任务结束后释放GPU预留和执行名额",
+                       _wait_for(lambda: not scheduler._reserved_gpus and scheduler._active_tasks == 0)))
+        
+        return _report_checks(checks)
+    except Exception as e:
+        print(f"任务分派限制测试失败: {e}")
+        return False
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        os.unlink(script_path)
+        os.unlink(gpu_script_path)
+
+def test_task_timestamps():
+    """测试任务时间戳以纳秒整数保存，序列化时输出ISO字符串"""
+    print("\n测试任务时间戳...")
+    try:
+        from datetime import datetime
+        from task_scheduler import Task
+        
+        checks = []
+        before = time.time_ns()
+        task = Task(id="task_time", script_path="example_python_script.py", required_gpus=0, gpu_indices=[])
+        after = time.time_ns()
+        checks.append(("created_at为纳秒整数",
+                       isinstance(task.created_at, int) and before <= task.created_at <= after))
+        
+        data = task.to_dict()
+        checks.append(("created_at序列化为ISO字符串",
+                       datetime.fromisoformat(data['created_at']) == datetime.fromtimestamp(task.created_at / 1e9)))
+        checks.append(("未开始的任务started_at为None",
+                       data['started_at'] is None and data['completed_at'] is None))
+        
+        task.started_at = time.time_ns()
+        started = task.to_dict()['started_at']
+        checks.append(("started_at序列化为ISO字符串",
+                       datetime.fromisoformat(started) == datetime.fromtimestamp(task.started_at / 1e9)))
+        
+        return _report_checks(checks)
+    except Exception as e:
+        print(f"任务时间戳测试失败: {e}")
+        return False
+
 def main():
     """主测试函数"""
     print("开始GPU调度系统测试...\n")
@@ -196,9 +616,18 @@ def main():
     tests = [
         ("GPU监控", test_gpu_monitor),
         ("脚本解析", test_script_parser),
+        ("GPU索引解析", test_gpu_index_parsing),
         ("任务调度", test_task_scheduler),
         ("脚本执行", test_script_executor),
-        ("脚本类型检测", test_script_type_detection)
+        ("脚本类型检测", test_script_type_detection),
+        ("JSON请求体校验", test_json_body_validation),
+        ("响应缓存与压缩", test_response_caching),
+        ("批量查询任务状态", test_batch_task_status),
+        ("任务队列顺序", test_task_queue_order),
+        ("已完成任务上限", test_completed_tasks_limit),
+        ("任务分派唤醒", test_dispatch_wakeup),
+        ("任务分派限制", test_dispatch_limits),
+        ("任务时间戳", test_task_timestamps)
     ]
     
     passed = 0
@@ -1,8 +1,16 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from quart import Quart, Response, render_template, request, websocket, make_response
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
+import orjson
+import jsonpatch
+from jinja2 import FileSystemBytecodeCache
+import asyncio
+import gzip
+import hashlib
 import logging
 import os
-from datetime import datetime
-import json
+import sys
+import time
 
 from task_scheduler import TaskScheduler
 
@@ -12,160 +20,514 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-app = Flask(__name__)
+# 调试模式，仅在环境变量DEBUG=1时启用
+DEBUG = os.getenv('DEBUG') == '1'
+
+# SCHEDULER_DAEMON=1时调度器运行在独立进程(scheduler_daemon.py)中，Web进程只作为客户端
+SCHEDULER_DAEMON = os.getenv('SCHEDULER_DAEMON') == '1'
+
+# orjson序列化选项
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+# 只读接口响应缓存的有效期（秒），有效期内的并发请求共享同一次计算和序列化
+_RESPONSE_CACHE_TTL = 0.5
+
+# 响应体超过该大小且客户端支持时使用gzip压缩
+_GZIP_MIN_SIZE = 1024
+
+# 长连接保持时间（秒），轮询间隔内连接不会被关闭，避免每次轮询重新建立连接
+_KEEP_ALIVE_SECONDS = 75
+
+# HTTP/2单连接上允许的并发流数量
+_H2_MAX_CONCURRENT_STREAMS = 100
+
+# 推送通道在没有调度器事件时重新检查状态的间隔（秒），用于反映GPU利用率等变化
+_PUSH_REFRESH_SECONDS = 3
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """使用orjson进行JSON序列化，由C扩展完成编码"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+app = Quart(__name__)
+app.json_provider_class = ORJSONProvider
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = 'gpu-scheduler-secret-key'
+app.config['TEMPLATES_AUTO_RELOAD'] = DEBUG
+
+# 模板编译结果缓存到磁盘，重启后无需重新解析模板；不指定目录时Jinja使用按用户区分的私有目录，
+# 并检查目录属主和权限，避免加载其他用户写入的字节码
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+
+def ojsonify(obj, status: int = 200) -> Response:
+    """将对象用orjson序列化为JSON响应，直接返回bytes，不经过字符串中转"""
+    return Response(orjson.dumps(obj, option=_ORJSON_OPTIONS), status=status, mimetype='application/json')
+
+
+class CachedBody:
+    """已序列化的响应体及其ETag，gzip压缩结果在首次需要时生成"""
+
+    __slots__ = ('body', 'etag', '_gzipped')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._gzipped = None
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class TTLCache:
+    """缓存已序列化的JSON响应体，有效期内直接返回，过期后由第一个请求重新计算；
+    提供version时，过期后若状态版本未变化则继续沿用原结果"""
+
+    def __init__(self, ttl: float, loader, version=None):
+        self.ttl = ttl
+        self._loader = loader
+        self._version = version
+        self._value = None
+        self._value_version = None
+        self._expires = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """使缓存立即过期"""
+        self._expires = 0.0
+
+    async def get(self) -> CachedBody:
+        # 持锁计算，过期瞬间到达的并发请求等待同一次结果而不是各自重复计算
+        async with self._lock:
+            if time.monotonic() >= self._expires:
+                # 先读取版本号再加载数据，加载期间发生的变化会使下次版本比较不一致而重新加载
+                version = self._version() if self._version else None
+                if self._value is None or version is None or version != self._value_version:
+                    value = await asyncio.to_thread(self._loader)
+                    self._value = CachedBody(orjson.dumps(value, option=_ORJSON_OPTIONS))
+                    self._value_version = version
+                self._expires = time.monotonic() + self.ttl
+            return self._value
+
+
+def _cached_json_response(cached: CachedBody) -> Response:
+    """根据If-None-Match返回304，否则按Accept-Encoding返回原始或gzip压缩的响应体
+
+    强ETag须区分内容编码，gzip压缩的响应体使用加-gz后缀的ETag，If-None-Match与任一编码的ETag匹配时返回304
+    """
+    gzip_etag = cached.etag + '-gz'
+    matched = next((etag for etag in (cached.etag, gzip_etag) if etag in request.if_none_match), None)
+    if matched is not None:
+        response = Response(b'', status=304)
+        response.set_etag(matched)
+    elif len(cached.body) >= _GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        response = Response(cached.gzipped(), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(gzip_etag)
+    else:
+        response = Response(cached.body, mimetype='application/json')
+        response.set_etag(cached.etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+async def _read_json_body():
+    """用orjson解析请求体，请求体不在请求对象上缓存；不是合法的JSON对象时返回None"""
+    raw = await request.get_data(cache=False)
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
 
 # 全局调度器实例 - 使用自定义配置
-scheduler = TaskScheduler(
-    retry_interval=5,    # 重试间隔5秒
-    idle_interval=1,     # 空闲间隔1秒
-    error_interval=5     # 错误间隔5秒
-)
+if SCHEDULER_DAEMON:
+    from scheduler_daemon import SchedulerClient
+    scheduler = SchedulerClient()
+else:
+    scheduler = TaskScheduler(
+        retry_interval=5,    # 重试间隔5秒
+        idle_interval=1,     # 空闲间隔1秒
+        error_interval=5     # 错误间隔5秒
+    )
+
+_status_cache = TTLCache(_RESPONSE_CACHE_TTL, scheduler.get_system_status)
+# 任务列表只在调度器状态变化时改变，按状态版本号复用序列化结果和ETag
+_tasks_cache = TTLCache(_RESPONSE_CACHE_TTL, scheduler.get_all_tasks, lambda: scheduler.state_version)
+
+
+def _invalidate_caches():
+    """调度器状态变化后使只读接口的缓存失效"""
+    _status_cache.invalidate()
+    _tasks_cache.invalidate()
+
+
+# 页面模板不依赖请求参数，启动时渲染一次，之后直接返回缓存的bytes
+_STATIC_PAGES = ('index.html', 'dashboard.html', 'tasks.html', 'config.html', 'logs.html')
+_page_cache = {}
+
+
+@app.before_serving
+async def _prerender_pages():
+    # url_for需要请求上下文，使用根路径的测试请求上下文渲染
+    async with app.test_request_context('/'):
+        for name in _STATIC_PAGES:
+            _page_cache[name] = (await render_template(name)).encode('utf-8')
+
+
+async def _render_page(name: str) -> Response:
+    """返回预渲染的页面，未预渲染时渲染后缓存；调试模式下每次重新渲染"""
+    body = _page_cache.get(name)
+    if body is None or DEBUG:
+        body = _page_cache[name] = (await render_template(name)).encode('utf-8')
+    return Response(body, mimetype='text/html')
 
 @app.route('/')
-def index():
+async def index():
     """主页"""
-    return render_template('index.html')
+    return await _render_page('index.html')
+
+class NotFound(Exception):
+    """请求的资源不存在，由错误处理器转换为404响应"""
+
+
+@app.errorhandler(NotFound)
+async def _handle_not_found(e):
+    return ojsonify({'error': str(e)}, 404)
+
+
+@app.errorhandler(Exception)
+async def _handle_error(e):
+    """统一处理接口异常，HTTP异常(如404路由、405方法)保持框架默认处理"""
+    if isinstance(e, HTTPException):
+        return e
+    logging.exception(f"请求处理失败: {request.path}, {e}")
+    return ojsonify({'error': str(e)}, 500)
 
 @app.route('/api/status')
-def get_status():
+async def get_status():
     """获取系统状态"""
-    try:
-        status = scheduler.get_system_status()
-        return jsonify(status)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return _cached_json_response(await _status_cache.get())
 
 @app.route('/api/tasks')
-def get_tasks():
+async def get_tasks():
     """获取所有任务"""
-    try:
-        tasks = scheduler.get_all_tasks()
-        return jsonify(tasks)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return _cached_json_response(await _tasks_cache.get())
 
 @app.route('/api/submit', methods=['POST'])
-def submit_task():
+async def submit_task():
     """提交任务"""
-    try:
-        data = request.get_json()
-        script_path = data.get('script_path')
-        priority = data.get('priority', 0)
-        
-        if not script_path:
-            return jsonify({'error': '脚本路径不能为空'}), 400
-        
-        task_id = scheduler.submit_task(script_path, priority)
-        return jsonify({'task_id': task_id, 'message': '任务提交成功'})
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    data = await _read_json_body()
+    if data is None:
+        return ojsonify({'error': '请求体必须是JSON对象'}, 400)
+    script_path = data.get('script_path')
+    priority = data.get('priority', 0)
+    
+    if not script_path:
+        return ojsonify({'error': '脚本路径不能为空'}, 400)
+    
+    task_id = await asyncio.to_thread(scheduler.submit_task, script_path, priority)
+    _invalidate_caches()
+    return ojsonify({'task_id': task_id, 'message': '任务提交成功'})
 
 @app.route('/api/task/<task_id>')
-def get_task_status(task_id):
+async def get_task_status(task_id):
     """获取任务状态"""
-    try:
-        task_status = scheduler.get_task_status(task_id)
-        if task_status:
-            return jsonify(task_status)
-        else:
-            return jsonify({'error': '任务不存在'}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    task_status = await asyncio.to_thread(scheduler.get_task_status, task_id)
+    if task_status:
+        return ojsonify(task_status)
+    raise NotFound('任务不存在')
+
+@app.route('/api/tasks/status', methods=['POST'])
+async def get_tasks_status():
+    """批量获取任务状态，请求体为{"ids": [...]}，不存在的任务对应null"""
+    data = await _read_json_body()
+    task_ids = data.get('ids') if data is not None else None
+    if not isinstance(task_ids, list) or not all(type(task_id) is str for task_id in task_ids):
+        return ojsonify({'error': 'ids必须是任务ID列表'}, 400)
+    
+    return ojsonify(await asyncio.to_thread(scheduler.get_tasks_status, task_ids))
 
 @app.route('/api/task/<task_id>/cancel', methods=['POST'])
-def cancel_task(task_id):
+async def cancel_task(task_id):
     """取消任务"""
-    try:
-        success = scheduler.cancel_task(task_id)
-        if success:
-            return jsonify({'message': '任务已取消'})
-        else:
-            return jsonify({'error': '任务不存在或无法取消'}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    success = await asyncio.to_thread(scheduler.cancel_task, task_id)
+    _invalidate_caches()
+    if success:
+        return ojsonify({'message': '任务已取消'})
+    raise NotFound('任务不存在或无法取消')
 
 @app.route('/api/start', methods=['POST'])
-def start_scheduler():
+async def start_scheduler():
     """启动调度器"""
-    try:
-        scheduler.start()
-        return jsonify({'message': '调度器已启动'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    await asyncio.to_thread(scheduler.start)
+    _invalidate_caches()
+    return ojsonify({'message': '调度器已启动'})
 
 @app.route('/api/stop', methods=['POST'])
-def stop_scheduler():
+async def stop_scheduler():
     """停止调度器"""
-    try:
-        scheduler.stop()
-        return jsonify({'message': '调度器已停止'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    await asyncio.to_thread(scheduler.stop)
+    _invalidate_caches()
+    return ojsonify({'message': '调度器已停止'})
+
+def _build_config_bytes() -> bytes:
+    """序列化当前调度器配置"""
+    return orjson.dumps({
+        'retry_interval': scheduler.retry_interval,
+        'idle_interval': scheduler.idle_interval,
+        'error_interval': scheduler.error_interval
+    })
+
+
+# 配置只在POST成功时变化，GET直接返回预先序列化的结果；
+# 独立调度器进程模式下其他worker也可能修改配置，每次从调度器进程读取
+_config_bytes = None if SCHEDULER_DAEMON else _build_config_bytes()
 
 @app.route('/api/config', methods=['GET', 'POST'])
-def config_scheduler():
+async def config_scheduler():
     """获取或设置调度器配置"""
-    try:
-        if request.method == 'GET':
-            # 获取当前配置
-            return jsonify({
-                'retry_interval': scheduler.retry_interval,
-                'idle_interval': scheduler.idle_interval,
-                'error_interval': scheduler.error_interval
-            })
-        else:
-            # 设置新配置
-            data = request.get_json()
-            retry_interval = data.get('retry_interval', 5)
-            idle_interval = data.get('idle_interval', 1)
-            error_interval = data.get('error_interval', 5)
-            
-            # 验证参数
-            if not all(isinstance(x, int) and x > 0 for x in [retry_interval, idle_interval, error_interval]):
-                return jsonify({'error': '所有间隔时间必须是正整数'}), 400
-            
-            # 更新配置
-            scheduler.retry_interval = retry_interval
-            scheduler.idle_interval = idle_interval
-            scheduler.error_interval = error_interval
-            
-            logging.info(f"调度器配置已更新 - 重试间隔: {retry_interval}s, 空闲间隔: {idle_interval}s, 错误间隔: {error_interval}s")
-            
-            return jsonify({
-                'message': '配置已更新',
-                'retry_interval': retry_interval,
-                'idle_interval': idle_interval,
-                'error_interval': error_interval
-            })
-            
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    global _config_bytes
+    if request.method == 'GET':
+        # 获取当前配置
+        if SCHEDULER_DAEMON:
+            return ojsonify(await asyncio.to_thread(scheduler.get_config))
+        return Response(_config_bytes, mimetype='application/json')
+    else:
+        # 设置新配置
+        data = await _read_json_body()
+        if data is None:
+            return ojsonify({'error': '请求体必须是JSON对象'}, 400)
+        retry_interval = data.get('retry_interval', 5)
+        idle_interval = data.get('idle_interval', 1)
+        error_interval = data.get('error_interval', 5)
+        
+        # 验证参数，bool是int的子类，需用type精确排除
+        for value in (retry_interval, idle_interval, error_interval):
+            if type(value) is not int or value <= 0:
+                return ojsonify({'error': '所有间隔时间必须是正整数'}, 400)
+        
+        # 更新配置
+        scheduler.retry_interval = retry_interval
+        scheduler.idle_interval = idle_interval
+        scheduler.error_interval = error_interval
+        if not SCHEDULER_DAEMON:
+            _config_bytes = _build_config_bytes()
+        
+        scheduler.notify_listeners()
+        _invalidate_caches()
+        logging.info(f"调度器配置已更新 - 重试间隔: {retry_interval}s, 空闲间隔: {idle_interval}s, 错误间隔: {error_interval}s")
+        
+        return ojsonify({
+            'message': '配置已更新',
+            'retry_interval': retry_interval,
+            'idle_interval': idle_interval,
+            'error_interval': error_interval
+        })
+
+class StatusBroadcaster:
+    """状态推送的共享数据源：每个状态版本只构建一次快照和JSON Patch，所有推送连接共用同一份消息"""
+
+    def __init__(self, loader, refresh: float):
+        self._loader = loader
+        self._refresh = refresh
+        self._changed = asyncio.Event()
+        self._cond = asyncio.Condition()
+        self._seq = 0
+        self._state = None
+        self._snapshot_message = None
+        self._patch_message = None
+        self._task = None
+
+    def notify(self):
+        """标记状态已变化，由事件循环线程调用"""
+        self._changed.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """状态变化时立即、否则每隔refresh秒重新构建快照，内容有变化时发布新版本"""
+        while True:
+            try:
+                await self._publish(await asyncio.to_thread(self._loader))
+            except Exception as e:
+                logging.error(f"构建推送状态失败: {e}")
+            try:
+                await asyncio.wait_for(self._changed.wait(), self._refresh)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+
+    async def _publish(self, state: dict):
+        patch = None
+        if self._state is not None:
+            patch = jsonpatch.make_patch(self._state, state).patch
+            if not patch:
+                return
+        async with self._cond:
+            self._seq += 1
+            self._state = state
+            self._snapshot_message = orjson.dumps({'type': 'snapshot', 'data': state}, option=_ORJSON_OPTIONS)
+            self._patch_message = orjson.dumps({'type': 'patch', 'data': patch}, option=_ORJSON_OPTIONS) if patch else None
+            self._cond.notify_all()
+
+    async def updates(self):
+        """为单个推送连接产出消息：首条为完整快照，之后为相邻版本间的差异；错过中间版本时重新发送快照"""
+        seq = 0
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._seq > seq)
+                if seq and self._seq == seq + 1 and self._patch_message is not None:
+                    message = self._patch_message
+                else:
+                    message = self._snapshot_message
+                seq = self._seq
+            yield message
+
+
+# 状态推送只包含仪表板展示的系统状态和任务数量，不包含任务列表；GPU利用率等变化由定时刷新反映
+_broadcaster = StatusBroadcaster(scheduler.get_system_status, _PUSH_REFRESH_SECONDS)
+_loop = None
+
+
+def _wake_subscribers():
+    _invalidate_caches()
+    _broadcaster.notify()
+
+
+def _on_state_change(version: int):
+    """调度器状态监听器，在调度器线程中执行，转交事件循环唤醒推送连接"""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake_subscribers)
+
+
+@app.before_serving
+async def _register_state_listener():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    scheduler.add_listener(_on_state_change)
+    _broadcaster.start()
+
+
+@app.after_serving
+async def _unregister_state_listener():
+    scheduler.remove_listener(_on_state_change)
+    await _broadcaster.stop()
+
+
+@app.before_serving
+async def _start_scheduler():
+    # 调度器随服务启动，只在提供服务的进程中运行一份；独立调度器进程自行管理生命周期
+    if not SCHEDULER_DAEMON:
+        scheduler.start()
+
+
+@app.after_serving
+async def _stop_scheduler():
+    if not SCHEDULER_DAEMON:
+        await asyncio.to_thread(scheduler.stop)
+
+
+@app.websocket('/ws/status')
+async def ws_status():
+    """WebSocket状态推送"""
+    async for message in _broadcaster.updates():
+        await websocket.send(message.decode())
+
+
+@app.route('/api/events')
+async def status_events():
+    """SSE状态推送，供无法使用WebSocket的环境使用"""
+    async def stream():
+        async for message in _broadcaster.updates():
+            yield b'data: ' + message + b'\n\n'
+
+    response = await make_response(stream(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.timeout = None
+    return response
 
 @app.route('/dashboard')
-def dashboard():
+async def dashboard():
     """仪表板页面"""
-    return render_template('dashboard.html')
+    return await _render_page('dashboard.html')
 
 @app.route('/tasks')
-def tasks_page():
+async def tasks_page():
     """任务管理页面"""
-    return render_template('tasks.html')
+    return await _render_page('tasks.html')
 
 @app.route('/config')
-def config_page():
+async def config_page():
     """配置页面"""
-    return render_template('config.html')
+    return await _render_page('config.html')
 
 @app.route('/logs')
-def logs_page():
+async def logs_page():
     """日志查看页面"""
-    return render_template('logs.html')
+    return await _render_page('logs.html')
+
+@app.after_request
+async def _set_api_cache_control(response):
+    # 接口数据需每次向服务端确认，配合ETag在未变化时返回304
+    if request.path.startswith('/api/') and 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def run_server():
+    """启动Web应用，DEBUG=1时使用开发服务器；配置了TLS证书时使用支持HTTP/2的Hypercorn，否则使用uvicorn"""
+    certfile = os.getenv('SSL_CERTFILE')
+    keyfile = os.getenv('SSL_KEYFILE')
+    if DEBUG:
+        # 关闭自动重载，避免重启进程时调度器中正在运行的任务丢失状态
+        app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    elif certfile and keyfile:
+        # 浏览器只在TLS上使用HTTP/2，多个轮询请求复用同一连接
+        from hypercorn.config import Config
+        from hypercorn.asyncio import serve
+        config = Config()
+        config.bind = ['0.0.0.0:5000']
+        config.certfile = certfile
+        config.keyfile = keyfile
+        config.keep_alive_timeout = _KEEP_ALIVE_SECONDS
+        config.h2_max_concurrent_streams = _H2_MAX_CONCURRENT_STREAMS
+        asyncio.run(serve(app, config))
+    else:
+        # 调度器运行在Web进程内时多个worker会各自运行一份调度器，默认只用一个worker；
+        # 需要多个worker时先启动scheduler_daemon.py并设置SCHEDULER_DAEMON=1
+        import uvicorn
+        workers = int(os.getenv('WEB_WORKERS', '1'))
+        if workers > 1 and not SCHEDULER_DAEMON:
+            logging.error(f"WEB_WORKERS={workers}需要独立调度器进程，请先启动scheduler_daemon.py并设置SCHEDULER_DAEMON=1")
+            sys.exit(1)
+        # 单worker时直接传入应用对象：以python web_app.py启动时按名称导入会再执行一遍模块，多创建一份调度器；
+        # 多worker时uvicorn要求以导入字符串指定应用
+        uvicorn.run(app if workers == 1 else 'web_app:app', host='0.0.0.0', port=5000,
+                    workers=workers, loop='uvloop', http='httptools',
+                    timeout_keep_alive=_KEEP_ALIVE_SECONDS)
 
 if __name__ == '__main__':
-    # 启动调度器
-    scheduler.start()
-    
-    # 启动Web应用
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    run_server() 
\ No newline at end of file